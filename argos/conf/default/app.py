@@ -25,6 +25,10 @@ ADMINS = ['ftzeng@gmail.com']
 
 CLUSTERING = {
     'hierarchy_path': '~/env/argos/hierarchy.ihac',
+    'shard_days': 7, # the length of the time window each hierarchy shard covers.
+    'shard_archive_path': '~/env/argos/shards/', # where the shards of closed windows are archived.
+    'journal_max_entries': 100, # compact the hierarchy journal into a fresh snapshot after this many changes.
+    'pipeline_path': '~/env/argos/bow_pipeline.pickle', # the bow pipeline trained into galaxy's PIPELINE_PATH; its hash versions the cached article vectors.
     'lower_limit_scale': 0.7,
     'upper_limit_scale': 1.3,
     'metric': 'euclidean',
@@ -33,6 +37,19 @@ CLUSTERING = {
     'weights': [400., 90., 30.],
     'min_articles': 3,
     'min_events': 3,
+    'vectorize_processes': None, # None uses all available cores.
+    'vectorize_chunk_size': 50,
+    'chunk_size': 1000, # how many unclustered articles the clustering worker loads and clusters at a time.
+    'summarize_countdown': 30, # seconds to wait before summarizing changed events/stories, to debounce them.
+    'summary_cache_size': 100000, # how many cached summaries to keep (see `argos.core.models.cluster.SummaryCache`).
+    'summarize_processes': None, # for summarizing clusters in bulk; None uses all available cores.
+    'summarize_chunk_size': 20,
+    'summarize_timeout': 60, # seconds to allow summarizing one cluster in bulk before giving up on it.
+}
+
+COLLECTING = {
+    'fetch_workers': 16, # how many of a feed's entries are fetched (and scored) at once.
+    'fetch_per_host': 4, # the most entries fetched from the same host at once.
 }
 
 from galaxy import conf as galaxy_conf
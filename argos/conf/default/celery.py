@@ -11,7 +11,7 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 # What modules to import on start.
 # Note that in production environments you will want to
 # remove the 'tests' tasks module.
-CELERY_IMPORTS = ('tests.util.tasks_test', 'argos.tasks', 'argos.tasks.periodic',)
+CELERY_IMPORTS = ('tests.util.tasks_test', 'argos.tasks', 'argos.tasks.periodic', 'argos.tasks.clusters',)
 
 # Propagate chord errors when they come up.
 CELERY_CHORD_PROPAGATES = True
@@ -57,6 +57,14 @@ CELERYBEAT_SCHEDULE = {
     'cluster-articles': {
         'task': 'argos.tasks.periodic.cluster_articles',
         'schedule': crontab(minute='*/10')
+    },
+    'expire-events': {
+        'task': 'argos.tasks.periodic.expire_events',
+        'schedule': crontab(minute=5)
+    },
+    'evict-summaries': {
+        'task': 'argos.tasks.periodic.evict_summaries',
+        'schedule': crontab(minute=35)
     }
 }
 
@@ -68,5 +76,6 @@ CELERY_DEFAULT_QUEUE = 'default'
 CELERY_QUEUES = (Queue('default'), Broadcast('broadcast_tasks'), Queue('clustering'))
 CELERY_ROUTES = {
         'argos.tasks.periodic.collect': {'queue': 'broadcast_tasks'},
-        'argos.tasks.periodic.cluster_articles': {'queue': 'clustering'}
+        'argos.tasks.periodic.cluster_articles': {'queue': 'clustering'},
+        'argos.tasks.periodic.expire_events': {'queue': 'clustering'}
 }
@@ -1,120 +1,475 @@
 import os
+import pickle
 from itertools import chain
-from difflib import SequenceMatcher
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 import numpy as np
-from scipy.sparse import csr_matrix, hstack
+from scipy.sparse import csr_matrix, hstack, vstack, diags
 from sklearn.preprocessing import normalize
-from galaxy import vectorize, concept_vectorize
+from sqlalchemy import text
 from galaxy.cluster.ihac import Hierarchy
 
 from argos.conf import APP
 from argos.datastore import db
+from argos.core.brain import journal, records, shards
+from argos.core.brain.records import ArticleRecord
+from argos.core.brain.shards import Shard
+from argos.core.brain.vectors import pipeline_version, vectorize_articles
 from argos.core.models import Article, Event, Story
+from argos.core.models.article import ArticleVector
+from argos.core.models.event import events_articles
 conf = APP['CLUSTERING']
 
-LOCK = '/tmp/hierarchy.lock'
+# Logging.
+from argos.util.logger import logger
+logger = logger(__name__)
+
+# The key of the Postgres advisory lock
+# which serves as the clustering lease.
+LOCK_KEY = 736372
+
+# The snip cache is kept next to each shard's hierarchy,
+# at `shard.path + SNIP_CACHE_EXT`.
+SNIP_CACHE_EXT = '.snip'
 
 class LockException(Exception):
     pass
 
-def load_hierarchy():
-    PATH = os.path.expanduser(conf['hierarchy_path'])
-    if os.path.exists(PATH):
-        return Hierarchy.load(PATH)
+_lease = {'conn': None, 'depth': 0}
+
+@contextmanager
+def lease():
+    """
+    Holds the clustering lease, so only one worker (on any host)
+    modifies the hierarchy at a time. Raises LockException if the lease
+    is held elsewhere.
+
+    The lease is a Postgres advisory lock held on a dedicated connection.
+    If the worker holding it dies, its connection closes and Postgres releases
+    the lock, so a crashed worker can't leave a stale lock behind.
+
+    The lease is reentrant within a process.
+    """
+    if _lease['depth'] == 0:
+        conn = db.engine.connect()
+        acquired = conn.execute(text('SELECT pg_try_advisory_lock(:key)'), key=LOCK_KEY).scalar()
+        if not acquired:
+            conn.close()
+            raise LockException('The hierarchy is locked.')
+        _lease['conn'] = conn
+
+    _lease['depth'] += 1
+    try:
+        yield
+    finally:
+        _lease['depth'] -= 1
+        if _lease['depth'] == 0:
+            conn = _lease['conn']
+            _lease['conn'] = None
+            try:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), key=LOCK_KEY)
+            finally:
+                conn.close()
+
+def load_hierarchy(shard):
+    """
+    Loads a shard's hierarchy from its last snapshot
+    and replays the journal of changes made since.
+
+    If the shard has no snapshot yet (e.g. it crashed before its first one was saved),
+    the journal is replayed onto a fresh hierarchy, since the nodes it fit
+    may already be committed to articles. The files of a hierarchy
+    which has been replaced (e.g. by a recluster) are moved out of the way
+    by whatever replaced it, see `manage.core.groom`.
+
+    Nodes which were fit but whose articles were never committed are pruned (see `prune_orphans`).
+    """
+    path = shard.path
+    journal.recover(path)
+
+    if os.path.exists(path):
+        h = Hierarchy.load(path)
     else:
-        return Hierarchy(metric=conf['metric'],
+        h = Hierarchy(metric=conf['metric'],
                       lower_limit_scale=conf['lower_limit_scale'],
                       upper_limit_scale=conf['upper_limit_scale'])
 
-def cluster(new_articles, snip=True):
+    for op, data in journal.entries(path):
+        if op == 'fit':
+            vecs, uuids = data
+            h.fit(dense_rows(vecs))
+        elif op == 'prune':
+            h.prune([h.to_iid(uuid) for uuid in data])
+
+    shard.hierarchy = h
+    prune_orphans(shard)
+    return h
+
+def prune_orphans(shard):
     """
-    Clusters a list of Articles into Events.
+    Prunes the nodes which were fit into a shard's hierarchy
+    but which no article holds, i.e. the process crashed (or the commit failed)
+    between fitting the articles and committing their node ids.
+    Otherwise the articles would be fit again next time, alongside their orphaned nodes.
 
-    Set `snip=False` if you do not want the events and stories generated.
+    Fits are journaled before their articles are committed, and the journal
+    is only compacted after, so any such nodes are still in the journal.
+    """
+    fitted = []
+    for op, data in journal.entries(shard.path):
+        if op == 'fit':
+            fitted += [shard.node_id(uuid) for uuid in data[1]]
+        elif op == 'prune':
+            pruned = set(shard.node_id(uuid) for uuid in data)
+            fitted = [id for id in fitted if id not in pruned]
+    if not fitted:
+        return
+
+    node_ids = set(id for id, in db.session.query(Article.node_id).filter(Article.node_id.between(*shard.node_range)))
+    orphans = [id for id in fitted if id not in node_ids]
+    if orphans:
+        logger.info('Pruning {0} nodes without articles from {1}.'.format(len(orphans), shard))
+        prune(shard, orphans)
+
+def save_hierarchy(shard):
+    """
+    Saves a fresh snapshot of a shard's hierarchy if there isn't one yet,
+    or if the journal has grown past `conf['journal_max_entries']`.
+    Otherwise its changes are already persisted in the journal.
     """
+    path = shard.path
+    if not os.path.exists(path) or journal.count(path) >= conf['journal_max_entries']:
+        journal.compact(shard.hierarchy, path)
 
-    # Simple locking mechanism, later a better one can be implemented:
-    # https://ask.github.io/celery/cookbook/tasks.html#ensuring-a-task-is-only-executed-one-at-a-time
-    if os.path.exists(LOCK):
-        raise LockException('The hierarchy is locked.')
+def fit(shard, vecs):
+    """
+    Fits vectors into a shard's hierarchy, recording the fit in the journal.
+    Returns the node ids for the vectors.
+    """
+    # Rows are densified one at a time as the hierarchy consumes them.
+    # The fit's node ids are journaled too, so that nodes fit
+    # without their articles being committed can be found (see `manage.core.groom`).
+    uuids = [int(uuid) for uuid in shard.hierarchy.fit(dense_rows(vecs))]
+    journal.append(shard.path, 'fit', (vecs, uuids))
+    return [shard.node_id(uuid) for uuid in uuids]
+
+def prune(shard, node_ids):
+    """
+    Prunes nodes from a shard's hierarchy, recording the prune in the journal.
+    """
+    h = shard.hierarchy
+    uuids = [shard.uuid(node_id) for node_id in node_ids]
+    h.prune([h.to_iid(uuid) for uuid in uuids])
+    journal.append(shard.path, 'prune', uuids)
 
-    # Create the lock file.
-    open(LOCK, 'a').close()
+def freeze_shards(now, loaded=None):
+    """
+    Freezes and archives the shards whose windows have closed.
 
-    try:
-        # Load the hierarchy.
-        h = load_hierarchy()
+    A frozen shard's events are deactivated, since they can no longer
+    get new articles, and its journal is compacted into its snapshot,
+    which is moved into the archive.
 
-        # Build the article vectors.
-        vecs = build_vectors(new_articles, conf['weights'])
+    Frozen shards are dropped from `loaded` (see `cluster`).
+    """
+    oldest, _ = shards.open_windows(now)
+    for index in shards.shard_indices():
+        if index >= oldest:
+            continue
+
+        shard = loaded.pop(index, None) if loaded is not None else None
+        shard = shard or Shard(index)
+        frozen = [id for id, in shard_events(shard).with_entities(Event.id)]
+        if frozen:
+            Event.query.filter(Event.id.in_(frozen)).update({Event.active: False}, synchronize_session='fetch')
+        db.session.commit()
 
-        # Fit the article vecs into the hierarchy.
-        node_ids = h.fit(vecs)
+        path = shard.path
+        journal.recover(path)
+        if journal.count(path):
+            if shard.hierarchy is None:
+                load_hierarchy(shard)
+            journal.compact(shard.hierarchy, path)
+        journal.clear(path)
+        if os.path.exists(path + SNIP_CACHE_EXT):
+            os.remove(path + SNIP_CACHE_EXT)
+        shards.archive(shard)
+
+    # Drop shards which closed without ever being saved.
+    if loaded is not None:
+        for index in [index for index in loaded if index < oldest]:
+            del loaded[index]
+
+def shard_events(shard):
+    """
+    Query for the active events in a shard.
+    """
+    return Event.query.filter(Event.active == True, Event.members.any(Article.node_id.between(*shard.node_range)))
 
-        # Match the articles with their node ids.
-        for i, a in enumerate(new_articles):
-            a.node_id = int(node_ids[i])
-        db.session.commit()
+def shard_stories(shard):
+    """
+    Query for the stories in a shard.
+    """
+    return Story.query.filter(Story.members.any(Event.members.any(Article.node_id.between(*shard.node_range))))
 
-        # Save the hierarchy.
-        h.save(os.path.expanduser(conf['hierarchy_path']))
+def cluster(new_articles, snip=True, defer=False, now=None, loaded=None):
+    """
+    Clusters a list of Articles (or `ArticleRecord`s, see `argos.core.brain.records`) into Events.
 
-        if snip:
-            snip_hierarchy(h)
+    Each article is fit into the shard for its time window
+    (see `argos.core.brain.shards`), as of `now` (which defaults to the current time).
+    Shards whose windows have closed are frozen first.
 
-    finally:
-        # Remove the lock file, we're good to go
-        os.remove(LOCK)
+    Set `snip=False` if you do not want the events and stories generated.
+    Otherwise, only the events and stories touched by these articles are re-snipped.
+
+    Set `defer=True` to only persist the events' and stories' memberships
+    when snipping, leaving their summaries and concepts to be updated
+    afterwards (see `argos.tasks.clusters`), outside of the clustering lease.
+
+    Shards are loaded from disk on every call, unless a `loaded` dict is passed,
+    in which case the shards are kept in it (by index) across calls.
+    This is only safe while the caller holds the lease the whole time,
+    e.g. when clustering many batches in a row (see `manage.core.groom`).
+
+    Returns the ids of the events and stories which were created or updated.
+    """
+    now = now or datetime.utcnow()
+    event_ids, story_ids = [], []
+
+    with lease():
+        freeze_shards(now, loaded=loaded)
+
+        # Build the article vectors.
+        vecs = build_vectors(new_articles, conf['weights'])
 
-def snip_hierarchy(hierarchy):
+        # Group the articles by shard.
+        rows = {}
+        for i, a in enumerate(new_articles):
+            rows.setdefault(shards.shard_for(a.created_at, now), []).append(i)
+
+        touched = []
+        for index, idx in sorted(rows.items()):
+            # Load the shard's hierarchy.
+            shard = loaded.get(index) if loaded is not None else None
+            if shard is None:
+                shard = Shard(index)
+                if loaded is not None:
+                    loaded[index] = shard
+            if shard.hierarchy is None:
+                load_hierarchy(shard)
+
+            # Fit the article vecs into the hierarchy.
+            node_ids = fit(shard, vecs[idx])
+
+            # Match the articles with their node ids.
+            for i, node_id in zip(idx, node_ids):
+                new_articles[i].node_id = node_id
+            touched.append(shard)
+
+        # Lean article records are saved in bulk, articles with the session.
+        try:
+            records.save([a for a in new_articles if isinstance(a, ArticleRecord)])
+            db.session.commit()
+        except Exception:
+            # The fits are journaled but no article holds their nodes,
+            # so the shards are dropped and their orphans pruned when they are reloaded.
+            if loaded is not None:
+                for shard in touched:
+                    loaded.pop(shard.index, None)
+            raise
+
+        for shard in touched:
+            if snip:
+                e_ids, s_ids = snip_hierarchy(shard, incremental=True, defer=defer)
+                event_ids += e_ids
+                story_ids += s_ids
+
+            # Save the hierarchy.
+            save_hierarchy(shard)
+
+    return event_ids, story_ids
+
+def snip_hierarchy(shard, incremental=False, defer=False):
     """
-    Snip the hierarchy at the event and story thresholds to build the events and stories.
+    Snip a shard's hierarchy at the event and story thresholds to build its events and stories.
 
     The `min_articles` param specifies the minimum amount of member articles required
     to create or preserve an event. If an existing event comes to have less than this
     minimum, it is deleted. Same for `min_events`, but with events=>stories.
+
+    If `incremental=True`, the clusters are compared to the ones from the last snip
+    (see `load_snip_cache`) and only the events and stories touching clusters
+    which have changed since then are triaged. Untouched events and stories are left as-is.
+    If there is no usable snip cache, this falls back to a full snip
+    (of the shard's events and stories).
+
+    If `defer=True`, events and stories are not summarized or conceptized.
+
+    Returns the ids of the events and stories which were created or updated.
     """
-    h = hierarchy
+    h = shard.hierarchy
 
-    # Get the clusters.
+    # Get the clusters, as lists of article node ids.
     event_clusters = h.clusters(distance_threshold=conf['event_threshold'], with_labels=False)
     story_clusters = h.clusters(distance_threshold=conf['story_threshold'], with_labels=False)
+    event_clusters = [[shard.node_id(uuid) for uuid in clus] for clus in event_clusters]
+    story_clusters = [[shard.node_id(uuid) for uuid in clus] for clus in story_clusters]
 
     # Filter out events that do not meet the minimum articles requirement.
     event_clusters = [clus for clus in event_clusters if len(clus) >= conf['min_articles']]
 
-    process_events(h, event_clusters)
+    # Clusters as sets, for comparing against the last snip.
+    event_sets = [frozenset(clus) for clus in event_clusters]
+    story_sets = [frozenset(clus) for clus in story_clusters]
+
+    cache = load_snip_cache(shard) if incremental else None
+    if cache is not None:
+        # Only consider clusters which are new since the last snip,
+        # and the nodes of those and of the clusters which have disappeared since.
+        event_clusters, touched = changed_clusters(cache['events'], event_clusters, event_sets)
+        events = Event.query.filter(Event.active == True, Event.members.any(Article.node_id.in_(list(touched)))).all() if touched else []
+        touched_, event_ids = process_events(shard, event_clusters, events=events, defer=defer)
+        touched |= touched_
+
+        story_clusters, _ = changed_clusters(cache['stories'], story_clusters, story_sets, touched=touched)
+    else:
+        _, event_ids = process_events(shard, event_clusters, events=shard_events(shard).all(), defer=defer)
 
     # Format `clusters` so that lists of articles are flattened to a list of their event ids.
     # e.g. [[1,2,3,4,5],[6,7,8,9]] => [[1,2],[3,4]]
     # the new list's sublists' members are now event ids.
+    node_events, event_nodes = event_memberships(set(chain.from_iterable(story_clusters)))
+
     story_clusters_ = []
     for clus in story_clusters:
         events = []
-        processed_articles = []
+        processed_articles = set()
         for a_id in clus:
-            a_id = a_id.item()
             if a_id not in processed_articles:
-                a = Article.query.filter_by(node_id=a_id).first()
-                if a.events:
-                    # TODO In their current design, articles could belong to multiple events.
-                    # For simplification we will just take the first one, but eventually this needs to be reconsidered.
-                    e = Article.query.filter_by(node_id=a_id).first().events[0]
-                    processed_articles += [a.node_id for a in e.articles]
-                    events.append(e.id)
+                # TODO In their current design, articles could belong to multiple events.
+                # For simplification we will just take the first one, but eventually this needs to be reconsidered.
+                e_id = node_events.get(a_id)
+                if e_id is not None:
+                    processed_articles |= event_nodes[e_id]
+                    events.append(e_id)
                 else:
-                    processed_articles.append(a_id)
+                    processed_articles.add(a_id)
         story_clusters_.append(events)
 
     # Filter out clusters which are below the minimum.
     story_clusters = [clus for clus in story_clusters_ if len(clus) >= conf['min_events']]
 
-    process_stories(story_clusters)
+    if cache is not None:
+        # Only the stories which share events with the touched clusters.
+        e_ids = list(set(chain.from_iterable(story_clusters_)))
+        stories = Story.query.filter(Story.members.any(Event.id.in_(e_ids))).all() if e_ids else []
+        story_ids = process_stories(story_clusters, stories=stories, defer=defer)
+    else:
+        story_ids = process_stories(story_clusters, stories=shard_stories(shard).all(), defer=defer)
+
+    save_snip_cache(shard, event_sets, story_sets)
+
+    return event_ids, story_ids
+
+
+def changed_clusters(previous, clusters, cluster_sets, touched=None):
+    """
+    Compares clusters against the ones from the last snip.
+
+    Args:
+        | previous (set)        -- set of frozensets, the clusters from the last snip
+        | clusters (list)       -- the current clusters
+        | cluster_sets (list)   -- the current clusters, as frozensets of plain ints
+        | touched (set)         -- node ids which are known to have changed;
+                                   clusters containing any of them are considered changed as well
+
+    Returns:
+        | changed (list)    -- the current clusters which have changed
+        | nodes (set)       -- the node ids of the changed clusters and of the
+                               previous clusters which no longer exist
+    """
+    touched = touched or set()
+    current = set(cluster_sets)
+
+    changed = []
+    nodes = set()
+    for clus, clus_set in zip(clusters, cluster_sets):
+        if clus_set not in previous or not clus_set.isdisjoint(touched):
+            changed.append(clus)
+            nodes |= clus_set
 
+    for clus_set in previous - current:
+        nodes |= clus_set
 
-def process_stories(clusters):
+    return changed, nodes
+
+
+def load_snip_cache(shard):
+    """
+    Loads the clusters from a shard's last snip, if there are any
+    and they were made with the current clustering params.
+    """
+    path = shard.path + SNIP_CACHE_EXT
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        cache = pickle.load(f)
+
+    if cache['params'] != snip_params():
+        return None
+    return cache
+
+
+def save_snip_cache(shard, event_sets, story_sets):
+    """
+    Saves the clusters from a shard's snip,
+    to compare against on the next one.
+    """
+    path = shard.path + SNIP_CACHE_EXT
+    cache = {
+        'params': snip_params(),
+        'events': set(event_sets),
+        'stories': set(story_sets)
+    }
+    with open(path, 'wb') as f:
+        pickle.dump(cache, f)
+
+
+def snip_params():
+    return conf['event_threshold'], conf['story_threshold'], conf['min_articles'], conf['min_events']
+
+
+def event_memberships(node_ids):
+    """
+    Looks up event memberships for a set of article node ids,
+    in a constant number of queries.
+
+    Returns:
+        | node_events (dict) -- maps node ids to the (first, i.e. lowest id) event their article belongs to
+        | event_nodes (dict) -- maps those events' ids to the set of their member node ids
+    """
+    node_events = {}
+    event_nodes = {}
+    if not node_ids:
+        return node_events, event_nodes
+
+    rows = db.session.query(Article.node_id, events_articles.c.event_id)\
+            .join(events_articles, events_articles.c.article_id == Article.id)\
+            .filter(Article.node_id.in_(list(node_ids)))\
+            .order_by(events_articles.c.event_id).all()
+    for node_id, event_id in rows:
+        node_events.setdefault(node_id, event_id)
+
+    for event_id, node_ids in member_node_ids(list(set(node_events.values()))).items():
+        event_nodes[event_id] = set(node_ids)
+
+    return node_events, event_nodes
+
+
+def process_stories(clusters, stories=None, defer=False):
     """
     Takes clusters of node uuids and
     builds, modifies, and deletes stories out of them.
@@ -124,22 +479,33 @@ def process_stories(clusters):
     e.g::
 
         [[1,2,3,4,5],[6,7,8,9]]
+
+    The clusters are triaged against `stories`, which defaults to all stories.
+
+    If `defer=True`, the stories are not summarized or conceptized.
+
+    Returns the ids of the stories which were created or updated.
     """
     story_map = {}
     existing = {}
 
-    # Yikes this might be too much
-    # TODO Should probably preserve existing story node id composition separately.
-    for s in Story.query.all():
+    if stories is None:
+        # Yikes this might be too much
+        # TODO Should probably preserve existing story node id composition separately.
+        stories = Story.query.all()
+
+    for s in stories:
         story_map[s.id] = s
         existing[s.id] = [e.id for e in s.events]
 
     # Figure out which stories to update, delete, and create.
     to_update, to_create, to_delete, unchanged = triage(existing, clusters)
+    created = []
 
     for e_ids in to_create:
         events = Event.query.filter(Event.id.in_(e_ids)).order_by(Event.created_at.desc()).all()
-        story = Story(events)
+        story = Story(events, update=not defer)
+        created.append(story)
 
         story.created_at = events[0].created_at
         story.updated_at = events[-1].created_at
@@ -160,7 +526,10 @@ def process_stories(clusters):
         s.title = events[0].title
         s.image = events[0].image
 
-        s.update()
+        if defer:
+            s.updated_at = datetime.utcnow()
+        else:
+            s.update()
 
     for s_id in to_delete:
         db.session.delete(story_map[s_id])
@@ -171,78 +540,158 @@ def process_stories(clusters):
     # http://stackoverflow.com/a/7954618/1097920
     Story.query.filter(~Story.members.any()).delete(synchronize_session='fetch')
 
+    return [s.id for s in created] + list(to_update.keys())
 
-def process_events(h, clusters):
+
+def process_events(shard, clusters, events=None, defer=False):
     """
     Takes clusters of node uuids and
     builds, modifies, and deletes events out of them.
+
+    The clusters are triaged against `events`, which defaults to all active events.
+
+    If `defer=True`, the events are not summarized or conceptized.
+
+    The events' member node ids, and the articles for the
+    created and updated events, are each loaded in a single query.
+
+    Expiring events are frozen separately, see `expire_events`.
+
+    Returns the node ids of the events which were created, updated, or deleted,
+    and the ids of the events which were created or updated.
     """
-    now = datetime.utcnow()
+    touched = set()
+
+    if events is None:
+        events = Event.all_active()
 
-    # Get existing event clusters.
-    event_map = {}
-    existing  = {}
-    for e in Event.all_active():
-        # Map event ids to their event, for lookup later.
-        event_map[e.id] = e
+    # Map event ids to their event, for lookup later.
+    event_map = {e.id: e for e in events}
 
-        # Map event ids to a list of their member node ids.
-        existing[e.id]  = [a.node_id for a in e.articles]
+    # Map event ids to a list of their member node ids.
+    members = member_node_ids(list(event_map.keys()))
+    existing = {e.id: members.get(e.id, []) for e in events}
 
     # Figure out which events to update, delete, and create.
     to_update, to_create, to_delete, unchanged = triage(existing, clusters)
+    created = []
+
+    # Load all the articles for the created and updated events at once.
+    node_ids = set(chain.from_iterable(to_create)) | set(chain.from_iterable(to_update.values()))
+    articles_by_node = {a.node_id: a for a in Article.query.filter(Article.node_id.in_(list(node_ids)))} if node_ids else {}
 
     for a_ids in to_create:
-        articles = Article.query.filter(Article.node_id.in_([id.item() for id in a_ids])).order_by(Article.created_at.desc()).all()
-        e = Event(articles)
+        touched.update(a_ids)
+        articles = sorted((articles_by_node[id] for id in a_ids), key=lambda a: a.created_at, reverse=True)
+        e = Event(articles, update=not defer)
+        created.append(e)
 
         e.created_at = articles[0].created_at
         e.updated_at = articles[-1].updated_at
 
-        rep_article = representative_article(h, a_ids, articles)
+        rep_article = representative_article(shard, a_ids, articles)
         e.title = rep_article.title
         e.image = rep_article.image
 
         db.session.add(e)
 
     for e_id, a_ids in to_update.items():
+        touched.update(existing[e_id])
+        touched.update(a_ids)
         e = event_map[e_id]
-        articles = Article.query.filter(Article.node_id.in_([id.item() for id in a_ids])).all()
+        articles = [articles_by_node[id] for id in a_ids]
         e.members = articles
 
-        rep_article = representative_article(h, a_ids, articles)
+        rep_article = representative_article(shard, a_ids, articles)
         e.title = rep_article.title
         e.image = rep_article.image
 
-        e.update()
-
-    # Freeze expiring events and clean up their articles from the hierarchy.
-    for e_id in unchanged:
-        e = event_map[e_id]
-        if (now - e.updated_at).days > 3:
-            e.active = False
-            nodes = [h.to_iid(a.node_id) for a in e.articles]
-            h.prune(nodes)
+        # If deferred, changing the members is enough to bump `updated_at`.
+        if not defer:
+            e.update()
 
     # Do this LAST so any of this event's associated articles
     # have a chance to be moved to their new clusters (if any).
     for e_id in to_delete:
+        touched.update(existing[e_id])
         db.session.delete(event_map[e_id])
         # does this need to prune the articles as well?
         # i think the assumption is that a deleted event's articles have all migrated elsewhere.
 
     db.session.commit()
 
+    return touched, [e.id for e in created] + list(to_update.keys())
+
+
+def expire_events(now=None):
+    """
+    Freezes expiring events, i.e. those which haven't been
+    updated for more than 3 (whole) days, and cleans up their articles from the hierarchy.
+
+    The events are found with one query and deactivated in one update,
+    and their articles are pruned in one batch per shard.
+    Articles in archived shards are left as they are.
+
+    This is maintenance which is run periodically (see `argos.tasks.periodic.expire_events`),
+    rather than on every snip.
+
+    Returns the ids of the frozen events.
+    """
+    now = now or datetime.utcnow()
+
+    with lease():
+        expired = [id for id, in Event.query.filter(Event.active == True, Event.updated_at <= now - timedelta(days=4)).with_entities(Event.id)]
+        if not expired:
+            return []
+
+        # Group the events' articles by shard.
+        node_ids = {}
+        for node_id in chain.from_iterable(member_node_ids(expired).values()):
+            node_ids.setdefault(shards.shard_of(node_id), []).append(node_id)
+
+        open_shards = shards.shard_indices()
+        for index, node_ids_ in node_ids.items():
+            if index in open_shards:
+                shard = Shard(index)
+                load_hierarchy(shard)
+                prune(shard, node_ids_)
+                save_hierarchy(shard)
+
+        Event.query.filter(Event.id.in_(expired)).update({Event.active: False}, synchronize_session='fetch')
+        db.session.commit()
+
+    return expired
+
 
-def representative_article(h, node_uuids, articles):
+def member_node_ids(event_ids):
+    """
+    Looks up the member node ids of events, in one query.
+
+    Returns:
+        | dict -- maps event ids to lists of their member node ids
+    """
+    members = {}
+    if not event_ids:
+        return members
+
+    rows = db.session.query(events_articles.c.event_id, Article.node_id)\
+            .join(Article, events_articles.c.article_id == Article.id)\
+            .filter(events_articles.c.event_id.in_(event_ids)).all()
+    for event_id, node_id in rows:
+        members.setdefault(event_id, []).append(node_id)
+    return members
+
+
+def representative_article(shard, node_ids, articles):
     """
     Returns the most representative article for a set of node ids.
     """
-    node_iids = [h.to_iid(uuid) for uuid in node_uuids]
+    h = shard.hierarchy
+    node_iids = [h.to_iid(shard.uuid(node_id)) for node_id in node_ids]
     rep_iid  = h.most_representative(node_iids)
-    rep_uuid = h.ids[rep_iid][0]
+    rep_node_id = shard.node_id(h.ids[rep_iid][0])
 
-    rep_article = next(a for a in articles if a.node_id==rep_uuid)
+    rep_article = next(a for a in articles if a.node_id==rep_node_id)
     return rep_article
 
 def triage(existing, new):
@@ -263,6 +712,12 @@ def triage(existing, new):
     to_create => [[article_ids], ...]
     to_delete => [event_id, ...]
     unchanged => [event_id, ...]
+
+    Clusters are compared by the similarity ratio `2*|a & b|/(|a| + |b|)`
+    (which is what `difflib.SequenceMatcher` gives for sorted lists of unique ids).
+    Rather than comparing every existing cluster to every new cluster,
+    an inverted index from article ids to new clusters is used,
+    so only clusters which share members are ever compared.
     """
     to_update = {}
     to_delete = []
@@ -271,22 +726,47 @@ def triage(existing, new):
     # Keep sorting consistent.
     new_clusters = [sorted(clus) for clus in new]
 
+    # Index which new clusters each article id belongs to.
+    index = {}
+    empty = []
+    for i, new_clus in enumerate(new_clusters):
+        if not new_clus:
+            empty.append(i)
+        for a_id in new_clus:
+            index.setdefault(a_id, []).append(i)
+
+    # New clusters which have been claimed by an existing cluster.
+    claimed = set()
+
     # For each existing cluster,
     for id, clus in existing.items():
-        # Keep sorting consistent.
-        clus = sorted(clus)
-        s = SequenceMatcher(a=clus)
 
-        # Compare to each remaining new cluster...
+        # An empty cluster can only match an empty cluster.
+        if not clus:
+            match = next((i for i in empty if i not in claimed), None)
+            if match is not None:
+                unchanged.append(id)
+                claimed.add(match)
+            else:
+                to_delete.append(id)
+            continue
+
+        # Count the overlap with each unclaimed new cluster that shares members.
+        overlaps = {}
+        for a_id in clus:
+            for i in index.get(a_id, ()):
+                if i not in claimed:
+                    overlaps[i] = overlaps.get(i, 0) + 1
+
+        # Compare to each overlapping new cluster, in their original order...
+        exact = None
         candidates = []
-        for i, new_clus in enumerate(new_clusters):
-            s.set_seq2(new_clus)
-            r = s.ratio()
+        for i in sorted(overlaps):
+            r = 2.0 * overlaps[i] / (len(clus) + len(new_clusters[i]))
 
             # If the similarity is 100%, then the cluster is unchanged.
             if r == 1.:
-                unchanged.append(id)
-                new_clusters.pop(i)
+                exact = i
                 break
 
             # If the similarity is over 50%, consider the new
@@ -294,23 +774,26 @@ def triage(existing, new):
             elif r >= 0.5:
                 candidates.append({'ratio': r, 'idx': i})
 
-        else:
-            # If we have candidates, get the most similar one.
-            if candidates:
-                candidates = sorted(candidates, key=lambda x: x['ratio'], reverse=True)
-                top = candidates[0]['idx']
+        if exact is not None:
+            unchanged.append(id)
+            claimed.add(exact)
 
-                # This new cluster is now claimed,
-                # remove it from the new clusters.
-                to_update[id] = new_clusters.pop(top)
+        # If we have candidates, get the most similar one.
+        elif candidates:
+            candidates = sorted(candidates, key=lambda x: x['ratio'], reverse=True)
+            top = candidates[0]['idx']
 
-            # If there were no matches for the old cluster,
-            # delete it.
-            else:
-                to_delete.append(id)
+            # This new cluster is now claimed.
+            to_update[id] = new_clusters[top]
+            claimed.add(top)
+
+        # If there were no matches for the old cluster,
+        # delete it.
+        else:
+            to_delete.append(id)
 
     # Any remaining new_clusters are considered new, independent clusters.
-    to_create = new_clusters
+    to_create = [clus for i, clus in enumerate(new_clusters) if i not in claimed]
 
     return to_update, to_create, to_delete, unchanged
 
@@ -318,28 +801,63 @@ def triage(existing, new):
 def build_vectors(articles, weights):
     """
     Build weighted vector representations for a list of articles.
+
+    The vectors are kept as a sparse (CSR) matrix throughout,
+    so memory scales with the number of non-zero entries
+    rather than with rows x columns.
+
+    The bow and concept vectors are read from each article's
+    vector cache. Articles which are missing them (or have stale ones)
+    are vectorized together in one batch.
     """
+    version = pipeline_version()
+
+    stale = [a for a in articles if a.vector is None or a.vector.version != version]
+    if stale:
+        results = vectorize_articles([(a.text, a.concept_slugs) for a in stale])
+        for a, (bow_vec, con_vec) in zip(stale, results):
+            a.vector = ArticleVector(version=version, bow=bow_vec, concepts=con_vec)
+
     pub_vecs, bow_vecs, con_vecs = [], [], []
     for a in articles:
-        pub_vecs.append(np.array([a.published]))
-        bow_vecs.append(vectorize(a.text))
-        con_vecs.append(concept_vectorize([c.slug for c in a.concepts]))
+        bow_vec, con_vec = a.vectorize(version)
+        pub_vecs.append([a.published])
+        bow_vecs.append(bow_vec)
+        con_vecs.append(con_vec)
 
-    pub_vecs = normalize(csr_matrix(pub_vecs), copy=False)
-    bow_vecs = normalize(csr_matrix(bow_vecs), copy=False)
-    con_vecs = normalize(csr_matrix(con_vecs), copy=False)
+    # The cached bow and concept vectors are already normalized.
+    pub_vecs = normalize(csr_matrix(pub_vecs, dtype=float), copy=False)
+    bow_vecs = vstack(bow_vecs, format='csr')
+    con_vecs = vstack(con_vecs, format='csr')
 
     # Merge vectors.
-    vecs = hstack([pub_vecs, bow_vecs, con_vecs])
-
-    # Convert to a scipy.sparse.lil_matrix because it is subscriptable.
-    vecs = vecs.tolil()
+    vecs = hstack([pub_vecs, bow_vecs, con_vecs], format='csr')
 
     # Apply weights to the proper columns:
-    # col 0 = pub, cols 1-101 = bow, 102+ = concepts
+    # col 0 = pub, then the bow cols, then the concept cols.
     # weights = [pub, bow, concept]
-    vecs[:,0]     *= weights[0]
-    vecs[:,1:101] *= weights[1]
-    vecs[:,101:]  *= weights[2]
+    widths = [pub_vecs.shape[1], bow_vecs.shape[1], con_vecs.shape[1]]
+    return weight_columns(vecs, widths, weights)
+
 
-    return vecs.toarray()
+def weight_columns(vecs, widths, weights):
+    """
+    Scales consecutive blocks of columns of a sparse matrix,
+    where the block `i` is `widths[i]` columns wide and is
+    multiplied by `weights[i]`.
+
+    This is done by right-multiplying by a diagonal matrix,
+    so the result stays in CSR format.
+    """
+    col_weights = np.repeat(np.asarray(weights, dtype=float), widths)
+    return vecs.dot(diags(col_weights, 0, format='csr')).tocsr()
+
+
+def dense_rows(vecs):
+    """
+    Yields the rows of a sparse matrix as dense 1d arrays,
+    one at a time, so that the full dense matrix
+    is never materialized.
+    """
+    for i in range(vecs.shape[0]):
+        yield vecs.getrow(i).toarray()[0]
@@ -0,0 +1,150 @@
+"""
+Journal
+==============
+
+An append-only journal of the changes
+(fits and prunes) made to the hierarchy since
+its last snapshot was saved.
+
+Saving a change is then proportional to the size
+of the change, rather than the size of the hierarchy.
+The journal is periodically compacted by saving a fresh snapshot
+and truncating the journal.
+
+Each entry is a length-prefixed pickle of `(op, data)`.
+If a write was interrupted (e.g. by a crash), the trailing
+partial entry is ignored when the journal is read.
+"""
+
+import os
+import pickle
+import struct
+
+# Entries are prefixed with their length as an unsigned 64bit int.
+HEADER = struct.Struct('>Q')
+
+JOURNAL_EXT = '.journal'
+COMPACTING_EXT = '.compacting'
+TMP_EXT = '.tmp'
+
+def append(path, op, data):
+    """
+    Appends an entry to the journal of the snapshot at `path`.
+
+    Args:
+        | path (str)    -- the path of the hierarchy snapshot
+        | op (str)      -- the operation, e.g. 'fit' or 'prune'
+        | data          -- the (picklable) data needed to replay the operation
+    """
+    entry = pickle.dumps((op, data), protocol=pickle.HIGHEST_PROTOCOL)
+    with open(path + JOURNAL_EXT, 'ab') as f:
+        f.write(HEADER.pack(len(entry)))
+        f.write(entry)
+        f.flush()
+        os.fsync(f.fileno())
+
+def entries(path):
+    """
+    Yields the `(op, data)` entries of the journal,
+    in the order they were appended.
+    """
+    journal_path = path + JOURNAL_EXT
+    if not os.path.exists(journal_path):
+        return
+
+    with open(journal_path, 'rb') as f:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            size, = HEADER.unpack(header)
+            entry = f.read(size)
+            if len(entry) < size:
+                break
+            yield pickle.loads(entry)
+
+def count(path):
+    """
+    Counts the (complete) entries of the journal,
+    without unpickling them.
+    """
+    return scan(path)[0]
+
+def scan(path):
+    """
+    Scans the journal's entry headers.
+
+    Returns:
+        | tuple -- (number of complete entries, byte offset where they end)
+    """
+    journal_path = path + JOURNAL_EXT
+    if not os.path.exists(journal_path):
+        return 0, 0
+
+    n, offset = 0, 0
+    end = os.path.getsize(journal_path)
+    with open(journal_path, 'rb') as f:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            size, = HEADER.unpack(header)
+            if f.tell() + size > end:
+                break
+            f.seek(size, os.SEEK_CUR)
+            n += 1
+            offset = f.tell()
+    return n, offset
+
+def clear(path):
+    """
+    Removes the journal.
+    """
+    if os.path.exists(path + JOURNAL_EXT):
+        os.remove(path + JOURNAL_EXT)
+
+def compact(hierarchy, path):
+    """
+    Saves a fresh snapshot of the hierarchy and truncates the journal.
+
+    The snapshot is first saved to a temporary file and then moved into place.
+    A marker file is kept from when the temporary snapshot is complete
+    until the journal is truncated, so that an interrupted compaction
+    can be resolved by `recover`.
+    """
+    hierarchy.save(path + TMP_EXT)
+    open(path + COMPACTING_EXT, 'a').close()
+    os.replace(path + TMP_EXT, path)
+    clear(path)
+    os.remove(path + COMPACTING_EXT)
+
+def recover(path):
+    """
+    Recovers from an interrupted write.
+
+    A partially written trailing entry is truncated,
+    so that later entries are appended after the last complete one.
+
+    An interrupted compaction is resolved as well.
+
+    If the new snapshot was not completely saved,
+    it is discarded and the old snapshot and journal are kept.
+    Otherwise the compaction is finished: the new snapshot already
+    includes the journal's changes, so the journal is discarded.
+    """
+    journal_path = path + JOURNAL_EXT
+    if os.path.exists(journal_path):
+        n, offset = scan(path)
+        if offset < os.path.getsize(journal_path):
+            with open(journal_path, 'r+b') as f:
+                f.truncate(offset)
+
+    if not os.path.exists(path + COMPACTING_EXT):
+        if os.path.exists(path + TMP_EXT):
+            os.remove(path + TMP_EXT)
+        return
+
+    if os.path.exists(path + TMP_EXT):
+        os.replace(path + TMP_EXT, path)
+    clear(path)
+    os.remove(path + COMPACTING_EXT)
@@ -0,0 +1,200 @@
+"""
+Records
+==============
+
+Lean records of articles, for the clustering worker.
+
+Loading `Article` ORM objects materializes their html and text,
+and their concepts are then lazily loaded one article at a time.
+Clustering only needs an article's id, time, and cached vectors
+(or its text and concept slugs, if its vectors need to be built),
+so only those are selected, into `__slots__` records.
+
+Unclustered articles are streamed in keyset-paginated chunks,
+so the worker's memory stays flat however large the backlog is.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import bindparam, tuple_, or_
+
+from argos.datastore import db
+from argos.core.brain.vectors import pipeline_version, vectorize_article
+from argos.core.models import Article
+from argos.core.models.article import ArticleVector, ArticleConceptAssociation, epoch
+from argos.core.models.concept import Concept
+
+# A cached vector, as a plain value rather than an `ArticleVector`.
+Vector = namedtuple('Vector', ['version', 'bow', 'concepts'])
+
+class ArticleRecord():
+    """
+    The parts of an article which are needed for clustering.
+
+    Records can be clustered just like articles (see `argos.core.brain.cluster.cluster`),
+    but changes to them are only persisted by `save`.
+    """
+    __slots__ = ['id', 'created_at', 'node_id', 'vector', 'text', 'concept_slugs', '_version']
+
+    def __init__(self, id, created_at, vector=None, text=None, concept_slugs=None):
+        self.id = id
+        self.created_at = created_at
+        self.node_id = None
+        self.vector = vector
+        self.text = text
+        self.concept_slugs = concept_slugs
+
+        # The version of the vector as loaded, to tell if it has been rebuilt since.
+        self._version = vector.version if vector is not None else None
+
+    def __repr__(self):
+        return '<ArticleRecord {0}>'.format(self.id)
+
+    def vectorize(self, version=None):
+        """
+        Returns this article's (bow, concept) vectors,
+        building them if they are missing or outdated.
+        """
+        if version is None:
+            version = pipeline_version()
+
+        if self.vector is None or self.vector.version != version:
+            bow, concepts = vectorize_article(self.text, self.concept_slugs)
+            self.vector = Vector(version, bow, concepts)
+
+        return self.vector.bow, self.vector.concepts
+
+    @property
+    def published(self):
+        """
+        Same as `Article.published`.
+        """
+        created_at = self.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=epoch.tzinfo)
+        return (created_at - epoch).total_seconds()
+
+
+def unclustered(chunk_size, chronological=False):
+    """
+    Yields chunks of records for the articles which have not been clustered yet,
+    in order of id. Each chunk is selected after the last id of the previous one,
+    so articles which come in meanwhile are picked up too.
+
+    If `chronological=True`, the articles are instead ordered by
+    their creation time (and then id), e.g. to replay them in order.
+
+    The articles' text and concept slugs are only loaded
+    for articles whose cached vectors are missing or outdated.
+    """
+    version = pipeline_version()
+    key = tuple_(Article.created_at, Article.id) if chronological else Article.id
+    last = None
+
+    while True:
+        query = db.session.query(Article.id, Article.created_at, ArticleVector.version, ArticleVector.bow, ArticleVector.concepts)\
+                .outerjoin(ArticleVector, ArticleVector.article_id == Article.id)\
+                .filter(Article.node_id == None)
+        if last is not None:
+            query = query.filter(key > last)
+        if chronological:
+            query = query.order_by(Article.created_at, Article.id)
+        else:
+            query = query.order_by(Article.id)
+
+        rows = query.limit(chunk_size).all()
+        if not rows:
+            return
+
+        records = [ArticleRecord(id, created_at, vector=Vector(v, bow, concepts) if v is not None else None)
+                   for id, created_at, v, bow, concepts in rows]
+        load_sources([r for r in records if r.vector is None or r.vector.version != version])
+
+        yield records
+        last = (records[-1].created_at, records[-1].id) if chronological else records[-1].id
+
+
+def stale(chunk_size):
+    """
+    Yields chunks of records for the articles whose cached vectors
+    are missing or outdated, in order of id, with their text and concept slugs loaded.
+    Vectorizing and saving (see `save_vectors`) each chunk before
+    moving onto the next one builds the cache for the whole corpus.
+    """
+    version = pipeline_version()
+    last_id = 0
+
+    while True:
+        ids = [id for id, in db.session.query(Article.id)\
+                .outerjoin(ArticleVector, ArticleVector.article_id == Article.id)\
+                .filter(Article.id > last_id, or_(ArticleVector.version == None, ArticleVector.version != version))\
+                .order_by(Article.id)\
+                .limit(chunk_size)]
+        if not ids:
+            return
+
+        records = [ArticleRecord(id, None) for id in ids]
+        load_sources(records)
+
+        yield records
+        last_id = ids[-1]
+
+
+def load_sources(records):
+    """
+    Loads the text and concept slugs of records,
+    which are needed to build their vectors, in two queries.
+    """
+    if not records:
+        return
+
+    by_id = {r.id: r for r in records}
+    for r in records:
+        r.concept_slugs = []
+
+    for id, text in db.session.query(Article.id, Article.text).filter(Article.id.in_(list(by_id.keys()))):
+        by_id[id].text = text
+
+    # Same as `Article.concept_slugs`: named concepts, by descending score.
+    rows = db.session.query(ArticleConceptAssociation.article_id, ArticleConceptAssociation.concept_slug)\
+            .join(Concept, Concept.slug == ArticleConceptAssociation.concept_slug)\
+            .filter(ArticleConceptAssociation.article_id.in_(list(by_id.keys())), Concept.name != None)\
+            .order_by(ArticleConceptAssociation.article_id, ArticleConceptAssociation.score.desc())
+    for id, slug in rows:
+        by_id[id].concept_slugs.append(slug)
+
+
+def save(records):
+    """
+    Persists the records' node ids, and their vectors if they were rebuilt,
+    in bulk. This does not commit.
+    """
+    if not records:
+        return
+
+    article = Article.__table__
+    db.session.execute(article.update()\
+            .where(article.c.id == bindparam('_id'))\
+            .values(node_id=bindparam('_node_id')),
+            [{'_id': r.id, '_node_id': r.node_id} for r in records])
+
+    save_vectors(records)
+
+
+def save_vectors(records):
+    """
+    Persists the records' vectors which were rebuilt, in bulk.
+    This does not commit.
+    """
+    rebuilt = [r for r in records if r.vector is not None and r.vector.version != r._version]
+    if rebuilt:
+        vector = ArticleVector.__table__
+        db.session.execute(vector.delete().where(vector.c.article_id.in_([r.id for r in rebuilt])))
+        db.session.execute(vector.insert(), [{
+            'article_id': r.id,
+            'version': r.vector.version,
+            'bow': r.vector.bow,
+            'concepts': r.vector.concepts
+        } for r in rebuilt])
+        for r in rebuilt:
+            r._version = r.vector.version
@@ -0,0 +1,147 @@
+"""
+Shards
+==============
+
+The hierarchy is partitioned into shards which
+each cover a window of time, `conf['shard_days']` long.
+
+Articles are fit into the shard of their window if it is open,
+that is, if it is the current window or the previous one.
+Articles from earlier windows go into the previous window's shard.
+Each article is fit into only one shard, since it has a single node,
+so events don't span shards: an event which carries on past the end of
+a window is split in two, one part in each window's shard.
+Once a window closes, its shard is frozen and archived
+(see `argos.core.brain.cluster.freeze_shards`), so at most two shards
+are ever loaded, however long the system has been running.
+
+Each shard is a regular hierarchy snapshot, with its own journal and snip cache,
+saved at `hierarchy_path.<index>`. A hierarchy from before sharding,
+saved at `hierarchy_path` itself, is treated as shard 0.
+
+Node ids are only unique within a hierarchy, so an article's node id
+is its node's id offset by its shard's index times `ID_STRIDE`.
+"""
+
+import os
+import re
+import shutil
+from datetime import datetime
+
+import pytz
+
+from argos.conf import APP
+from argos.core.brain import journal
+conf = APP['CLUSTERING']
+
+# Windows are counted from here.
+EPOCH = datetime(1970, 1, 1)
+
+# Each shard gets this many node ids.
+ID_STRIDE = 10**9
+
+class Shard():
+    """
+    A shard of the hierarchy.
+    Its hierarchy is set by `argos.core.brain.cluster.load_hierarchy`.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.hierarchy = None
+
+    def __repr__(self):
+        return '<Shard {0}>'.format(self.index)
+
+    @property
+    def path(self):
+        return shard_path(self.index)
+
+    @property
+    def node_range(self):
+        """
+        The (inclusive) range of node ids in this shard.
+        """
+        start = self.index * ID_STRIDE
+        return start, start + ID_STRIDE - 1
+
+    def node_id(self, uuid):
+        """
+        Converts the id of a node in this shard's hierarchy to an article node id.
+        """
+        return self.index * ID_STRIDE + int(uuid)
+
+    def uuid(self, node_id):
+        """
+        Converts an article node id to the id of its node in this shard's hierarchy.
+        """
+        return node_id - self.index * ID_STRIDE
+
+
+def window(dt):
+    """
+    Returns the index of the window a datetime falls into.
+    Windows start at 1; 0 is reserved for the pre-sharding hierarchy.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(pytz.UTC).replace(tzinfo=None)
+    return (dt - EPOCH).days // conf['shard_days'] + 1
+
+
+def open_windows(now):
+    """
+    Returns the indices of the previous and current windows.
+    """
+    current = window(now)
+    return current - 1, current
+
+
+def shard_for(dt, now):
+    """
+    Returns the index of the shard an article from `dt` is fit into.
+    """
+    previous, current = open_windows(now)
+    return min(max(window(dt), previous), current)
+
+
+def shard_of(node_id):
+    """
+    Returns the index of the shard a node id belongs to.
+    """
+    return node_id // ID_STRIDE
+
+
+def shard_path(index):
+    path = os.path.expanduser(conf['hierarchy_path'])
+    if index == 0:
+        return path
+    return '{0}.{1}'.format(path, index)
+
+
+def shard_indices():
+    """
+    Returns the indices of the (unarchived) shards on disk.
+    """
+    path = os.path.expanduser(conf['hierarchy_path'])
+    directory, name = os.path.split(path)
+    pattern = re.compile(r'^{0}(\.(\d+))?({1})?$'.format(re.escape(name), re.escape(journal.JOURNAL_EXT)))
+
+    indices = set()
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            match = pattern.match(filename)
+            if match:
+                indices.add(int(match.group(2) or 0))
+    return sorted(indices)
+
+
+def archive(shard):
+    """
+    Moves a shard's snapshot into the archive, `conf['shard_archive_path']`.
+    The shard's journal should already be compacted into the snapshot.
+    """
+    archive_path = os.path.expanduser(conf['shard_archive_path'])
+    if not os.path.exists(archive_path):
+        os.makedirs(archive_path)
+
+    if os.path.exists(shard.path):
+        shutil.move(shard.path, os.path.join(archive_path, os.path.basename(shard.path)))
@@ -5,16 +5,98 @@ Summarizer
 Summarizes documents.
 """
 
+import signal
 from re import sub
 from math import fabs
+from hashlib import sha1
+from itertools import chain
 from collections import Counter
+from contextlib import contextmanager
+from multiprocessing import cpu_count
 
-from scipy.spatial.distance import cosine
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.preprocessing import normalize
 from nltk.tokenize import sent_tokenize
 from galaxy.vector import tokenize, stopwords, vectorize
 
+from argos.core.brain.vectors import pipeline_version
+
+# billiard is Celery's fork of multiprocessing,
+# see `argos.core.brain.vectors`.
+from billiard import Pool
+
+from argos.conf import APP
+conf = APP['CLUSTERING']
+
+# Logging.
+from argos.util.logger import logger
+logger = logger(__name__)
+
 IDEAL_WORDS = 20
 
+class Sentences():
+    """
+    The sentences of a batch of documents,
+    split, tokenized, and (optionally) vectorized in one pass.
+
+    Documents which are summarized together (e.g. the members of an event)
+    often share sentences, so each distinct sentence
+    is only tokenized and vectorized once.
+
+    Attributes:
+        | texts (list)      -- the sentences, in document order
+        | positions (list)  -- the (1-based) position of each sentence in its document
+        | docs (list)       -- the index of each sentence's document
+        | tokens (list)     -- the tokens of each sentence
+        | vecs (csr_matrix) -- the sentence vectors, normalized to unit length (if `vectors=True`)
+        | empty (array)     -- boolean mask of the sentences with empty vectors (if `vectors=True`)
+
+    If `strip=True`, special characters are stripped from the sentences before they are tokenized
+    (e.g. so that "U.S." is tokenized as "us").
+    """
+    def __init__(self, docs, vectors=True, strip=False):
+        self.texts, self.positions, self.docs = [], [], []
+        for i, doc in enumerate(docs):
+            for pos, sent in enumerate(sent_tokenize(doc)):
+                self.texts.append(sent)
+                self.positions.append(pos + 1)
+                self.docs.append(i)
+
+        # Map each sentence to its distinct sentence.
+        distinct = {}
+        index = [distinct.setdefault(sent, len(distinct)) for sent in self.texts]
+        distinct = sorted(distinct, key=distinct.get)
+
+        tokens = [tokenize(strip_special(sent) if strip else sent) for sent in distinct]
+        self.tokens = [tokens[i] for i in index]
+
+        self.vecs, self.empty = None, None
+        if vectors and distinct:
+            vecs = vectorize_sentences(distinct)
+            empty = np.asarray(vecs.multiply(vecs).sum(axis=1)).ravel() == 0
+            vecs = normalize(vecs, copy=False)
+            self.vecs, self.empty = vecs[index], empty[index]
+
+    def __len__(self):
+        return len(self.texts)
+
+
+def strip_special(text):
+    """
+    Strips special characters (anything but word characters and spaces).
+    """
+    return sub(r'[^\w ]', '', text)
+
+
+def vectorize_sentences(sents):
+    """
+    Vectorizes sentences into a single (sparse) matrix,
+    one row per sentence.
+    """
+    return vstack([csr_matrix(vectorize(sent), dtype=float) for sent in sents], format='csr')
+
+
 def summarize(title, text, summary_length=5):
     """
     Summarizes a single document.
@@ -30,24 +112,31 @@ def summarize(title, text, summary_length=5):
     Currently uses a modified version of `PyTeaser <https://github.com/xiaoxu193/PyTeaser>`, which is based off of `TextTeaser <https://github.com/MojoJolo/textteaser>`.
     """
     summary = []
-    keys = keywords(text)
     title_tokens = tokenize(title)
 
+    # Tokenize the document once, into its sentences' tokens,
+    # from which both its keywords and its sentences' features are computed.
+    sents = Sentences([text], vectors=False, strip=True)
+    keys = keywords(text, tokens=chain.from_iterable(sents.tokens))
+
     # Score sentences and use the top selections.
-    ranks = score(sent_tokenize(text), title_tokens, keys).most_common(summary_length)
+    ranks = score(sents.texts, title_tokens, keys, tokens=sents.tokens).most_common(summary_length)
     for rank in ranks:
         summary.append(rank[0])
 
     return summary
 
 
-def multisummarize(docs, summary_length=5):
+def multisummarize(docs, summary_length=5, clusters=None, sources=False):
     """
     Summarize multi documents.
 
     Args:
         | docs (list)           -- list of documents (i.e. texts)
         | summary_length (int)  -- the preferred sentence length of the summary (default=5)
+        | clusters (SentenceClusters)   -- the clusters from summarizing the first of these documents before,
+                                           to only add the rest of the documents to (they are modified in place)
+        | sources (bool)        -- whether to return the index of the document each sentence was selected from
 
     .. note::
         The current implementation is super naive,
@@ -56,155 +145,463 @@ def multisummarize(docs, summary_length=5):
         multidoc summarization.
 
     Returns:
-        | summary (list)    -- list of sentences selected for the summary.
+        | summary (list)    -- list of sentences selected for the summary,
+                               or of (sentence, document index) tuples if `sources=True`.
+    """
+    if clusters is None:
+        clusters = SentenceClusters()
+    elif not clusters.extends(docs):
+        raise ValueError('The documents do not extend the ones which were clustered.')
 
-    .. note::
-        BTW: this is super slow. takes well over a minute for 4 moderately-sized documents.
+    clusters.add(docs[len(clusters.doc_keys):])
+    return clusters.summarize(summary_length, sources=sources)
+
+
+class SummaryTimeout(Exception):
+    pass
+
+def summarize_many(jobs, processes=None, chunk_size=None, timeout=None, clusters=False):
+    """
+    Summarizes a batch of documents or groups of documents,
+    e.g. to rebuild the summaries of many events at once.
+
+    A job with one text is summarized with `summarize`,
+    and a job with several texts with `multisummarize`.
+
+    The jobs are split into chunks which are summarized
+    over a process pool (sized to the host's cores by default).
+    Small batches, which fit in a single chunk, are summarized
+    in this process to avoid the pool's overhead.
+
+    A job which takes longer than `timeout` seconds is given up on,
+    and left out of the results, so one pathological cluster
+    doesn't hold up the whole batch.
+
+    Args:
+        | jobs (list)           -- list of (id, title, texts) tuples; the title is only used for jobs with one text
+        | processes (int)       -- number of worker processes (default=conf['summarize_processes'] or the number of cores)
+        | chunk_size (int)      -- number of jobs per chunk (default=conf['summarize_chunk_size'])
+        | timeout (float)       -- seconds to allow each job (default=conf['summarize_timeout']), 0 for no limit
+        | clusters (bool)       -- whether to also return the `SentenceClusters` of jobs with several texts
+
+    Returns:
+        | dict -- mapping job ids to the (summary, sentence clusters or None) of the jobs which finished,
+                  where the summary is a list of (sentence, index of the text it was selected from) tuples
+    """
+    processes = processes or conf['summarize_processes'] or cpu_count()
+    chunk_size = chunk_size or conf['summarize_chunk_size']
+    timeout = conf['summarize_timeout'] if timeout is None else timeout
+
+    chunks = [jobs[i:i+chunk_size] for i in range(0, len(jobs), chunk_size)]
+    if len(chunks) <= 1 or processes <= 1:
+        results = list(chain.from_iterable(summarize_chunk(chunk, timeout, clusters) for chunk in chunks))
+
+    else:
+        results = []
+        pool = Pool(processes=min(processes, len(chunks)))
+        try:
+            pending = [pool.apply_async(summarize_chunk, (chunk, timeout, clusters)) for chunk in chunks]
+            for chunk, result in zip(chunks, pending):
+                try:
+                    # Jobs are timed out within the workers, this only
+                    # guards against a worker which is stuck outside of Python.
+                    results.extend(result.get(2 * timeout * len(chunk) if timeout else None))
+                except Exception:
+                    logger.exception('Gave up on summarizing jobs {0}.'.format([id for id, title, texts in chunk]))
+        finally:
+            pool.terminate()
+            pool.join()
+
+    return {id: (summary, sent_clusters) for id, summary, sent_clusters in results if summary is not None}
+
+def summarize_chunk(jobs, timeout, clusters):
+    """
+    Summarizes a chunk of (id, title, texts) jobs, see `summarize_many`.
+    A job which timed out or failed has a summary of None.
+    """
+    results = []
+    for id, title, texts in jobs:
+        summary, sent_clusters = None, None
+        try:
+            with time_limit(timeout):
+                if len(texts) == 1:
+                    summary = [(sent, 0) for sent in summarize(title, texts[0])]
+                else:
+                    sent_clusters = SentenceClusters()
+                    summary = multisummarize(texts, clusters=sent_clusters, sources=True)
+        except SummaryTimeout:
+            logger.warning('Summarizing job {0} ({1} texts) took over {2}sec, skipping it.'.format(id, len(texts), timeout))
+        except Exception:
+            logger.exception('Failed to summarize job {0}.'.format(id))
+        results.append((id, summary, sent_clusters if clusters and summary is not None else None))
+    return results
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Raises `SummaryTimeout` in the block if it runs over `seconds`.
+
+    This relies on SIGALRM, which can only be handled in the main thread,
+    so elsewhere (or if `seconds` is 0 or None) the block isn't limited.
+    """
+    def expire(signum, frame):
+        raise SummaryTimeout()
+
+    if not seconds:
+        yield
+        return
+
+    try:
+        previous = signal.signal(signal.SIGALRM, expire)
+    except ValueError:
+        # Not in the main thread.
+        yield
+        return
+
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class SentenceClusters():
     """
-    # Collect all sentences from the input documents.
-    # Also collect position information about each sentence.
-    sents = []
-    for doc in docs:
-        sents += [(sent, vectorize(sent), pos + 1) for pos, sent in enumerate(sent_tokenize(doc))]
-    clusters = []
-
-    # Cluster the sentences.
-    for sent in sents:
-        # sent = (sent, vec, pos)
-
-        # Keep track of the maximum scoring cluster
-        # (above some minimum similarity)
-        # and the avg sim score.
-        # The higher the min_sim,
-        # the harder it is to join a cluster.
-        min_sim = 0.2
-        max_cluster = None, min_sim
-        for cluster in clusters:
-            avg_sim = 0
-            for sent_c in cluster:
-                avg_sim += (1 - cosine(sent[1], sent_c[1]))
-            avg_sim = avg_sim/len(cluster)
-            if avg_sim >= max_cluster[1]:
-                max_cluster = cluster, avg_sim
-
-        # If a cluster was found,
-        # add the sentence to it
-        if max_cluster[0]:
-            max_cluster[0].append(sent)
-
-        # Otherwise, create a new cluster.
+    The sentences of a batch of documents, greedily clustered (see `cluster_sentences`),
+    from which a multi document summary is selected (see `multisummarize`).
+
+    Documents can be added later on, e.g. as an event gains articles.
+    Since sentences are clustered in order, only the new documents' sentences
+    are clustered, and the result is the same as clustering all the documents at once.
+
+    The clusters are kept as the sum of their members' (unit) vectors,
+    so scoring new sentences against them is one matrix product.
+
+    Clusters are picklable, so they can be persisted between updates.
+    They are only valid for the sentence vectorizing pipeline
+    they were built with (see `pipeline_version`).
+    """
+    def __init__(self, min_sim=0.2):
+        self.min_sim = min_sim
+        self.version = pipeline_version()
+        self.doc_keys = []
+
+        # Per sentence.
+        self.texts, self.positions, self.lengths, self.docs = [], [], [], []
+        self.vecs = None
+        self.empty = np.zeros(0, dtype=bool)
+        self.labels = np.zeros(0, dtype=int)
+
+        # Per cluster.
+        self.centroids = None
+        self.joinable = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.joinable)
+
+    @staticmethod
+    def doc_key(doc):
+        return sha1(doc.encode('utf-8')).hexdigest()
+
+    def extends(self, docs):
+        """
+        Whether `docs` starts with the documents already added to these clusters,
+        (i.e. whether they can be summarized by adding the rest of `docs`)
+        and these clusters were built with the current pipeline.
+        """
+        n = len(self.doc_keys)
+        return self.version == pipeline_version() \
+                and len(docs) >= n \
+                and [self.doc_key(doc) for doc in docs[:n]] == self.doc_keys
+
+    def add(self, docs):
+        """
+        Adds documents, clustering their sentences.
+        """
+        offset = len(self.doc_keys)
+        self.doc_keys = self.doc_keys + [self.doc_key(doc) for doc in docs]
+
+        # Collect all sentences from the input documents,
+        # with their positions, tokens, and vectors.
+        # The vectors are of unit length, so that their cosine similarities are dot products.
+        sents = Sentences(docs)
+        if not len(sents):
+            return
+
+        k = len(self)
+        if k:
+            sizes = np.bincount(self.labels, minlength=k).astype(float)
+            clusters, centroids = cluster_sentences(sents.vecs, sents.empty, self.min_sim,
+                                                    centroids=self.centroids, sizes=sizes, joinable=self.joinable)
         else:
-            clusters.append([sent])
-
-    # Rank the clusters.
-    # Assuming that clusters with more sentences are more important,
-    # take the top 5.
-    ranked_clusters = sorted(clusters, key=lambda x: -len(x))[:summary_length]
-
-    # For each sentence cluster, select the highest scoring sentence.
-    # Again - very naive.
-    ideal_length = 20
-    summary_sentences = []
-    for cluster in ranked_clusters:
-        max_sent = '', 0
-        for sent in cluster:
-            avg_sim = 0
-            for sent_c in cluster:
-                avg_sim += 1 - cosine(sent[1], sent_c[1])
-            avg_sim = avg_sim/len(cluster)
-            pos = sent[2]
-            length = fabs(ideal_length - len(tokenize(sent[0])))/ideal_length
+            clusters, centroids = cluster_sentences(sents.vecs, sents.empty, self.min_sim)
+
+        n = len(sents)
+        labels = np.zeros(n, dtype=int)
+        for c, members in enumerate(clusters):
+            labels[members] = c
+
+        # A new cluster is joinable unless it was started by an empty sentence.
+        joinable = np.zeros(len(clusters), dtype=bool)
+        joinable[:k] = self.joinable
+        for c in range(k, len(clusters)):
+            joinable[c] = not sents.empty[clusters[c][0]]
+
+        self.texts = self.texts + sents.texts
+        self.positions = self.positions + sents.positions
+        self.lengths = self.lengths + [len(tokens) for tokens in sents.tokens]
+        self.docs = self.docs + [offset + i for i in sents.docs]
+        self.vecs = vstack([self.vecs, sents.vecs], format='csr') if self.vecs is not None else sents.vecs
+        self.empty = np.concatenate([self.empty, sents.empty])
+        self.labels = np.concatenate([self.labels, labels])
+        self.centroids = centroids
+        self.joinable = joinable
+
+    def summarize(self, summary_length=5, sources=False):
+        """
+        Selects a summary from the clusters.
+
+        Returns:
+            | summary (list)    -- list of sentences selected for the summary,
+                                   or of (sentence, document index) tuples if `sources=True`.
+        """
+        sizes = np.bincount(self.labels, minlength=len(self))
+
+        # Rank the clusters.
+        # Assuming that clusters with more sentences are more important,
+        # take the top 5.
+        ranked = sorted(range(len(self)), key=lambda c: -sizes[c])[:summary_length]
+
+        # For each sentence cluster, select the highest scoring sentence.
+        # Again - very naive.
+        ideal_length = 20
+        summary_sentences = []
+        for c in ranked:
+            members = np.flatnonzero(self.labels == c)
+
+            # The similarity of a cosine with an empty vector is undefined,
+            # so no sentence of a cluster with one can be scored.
+            if self.empty[members].any():
+                summary_sentences.append(('', None))
+                continue
+
+            # The average similarity of each member to the cluster's members.
+            vecs = self.vecs[members]
+            avg_sims = np.asarray(vecs.dot(vecs.T).sum(axis=1)).ravel()/len(members)
+            pos = np.array([self.positions[i] for i in members], dtype=float)
+            length = np.array([fabs(ideal_length - self.lengths[i]) for i in members])/ideal_length
 
             # Score is the average similarity penalized by distance from ideal length,
             # weighted by the inverse of the position.
-            score = (avg_sim - length/2)/pos
-            if score >= max_sent[1]:
-                max_sent = sent[0], score
-        summary_sentences.append(max_sent[0])
+            scores = (avg_sims - length/2)/pos
 
-    return summary_sentences
+            # Ties go to the later sentence, and only non-negative scores are selected.
+            best = len(scores) - 1 - np.argmax(scores[::-1])
+            if scores[best] >= 0:
+                summary_sentences.append((self.texts[members[best]], self.docs[members[best]]))
+            else:
+                summary_sentences.append(('', None))
 
+        if not sources:
+            return [sent for sent, doc in summary_sentences]
+        return summary_sentences
 
 
-def score(sentences, title_words, keywords):
+def cluster_sentences(vecs, empty, min_sim=0.2, centroids=None, sizes=None, joinable=None):
+    """
+    Greedily clusters sentences, in order: each sentence joins the cluster
+    it has the highest average cosine similarity to (if that is at least `min_sim`,
+    ties going to the later cluster), or otherwise starts a new cluster.
+    The higher the `min_sim`, the harder it is to join a cluster.
+
+    Rather than comparing a sentence with every member of every cluster,
+    each cluster keeps the sum of its members' similarities to the sentences,
+    which is updated in place as sentences join it. So a sentence's average similarity
+    to the clusters' members is a column of these sums divided by the clusters' sizes.
+    The similarities are computed up front, in one (sparse) matrix product,
+    and the clusters' summed vectors once they are all clustered.
+
+    To add the sentences to existing clusters, pass the clusters' summed vectors as `centroids`,
+    their `sizes`, and whether they are `joinable` (see `SentenceClusters`).
+    The existing clusters come first in the returned clusters,
+    with only the sentences which joined them.
+
+    Args:
+        | vecs (csr_matrix)     -- the sentence vectors, normalized to unit length
+        | empty (array)         -- boolean mask of the sentences with empty vectors,
+                                   whose similarities are undefined (they always start their own cluster,
+                                   which no other sentence can join)
+        | min_sim (float)       -- the minimum average similarity to join a cluster
+        | centroids (csr_matrix)    -- the sums of the existing clusters' vectors
+        | sizes (array)         -- the sizes of the existing clusters
+        | joinable (array)      -- boolean mask of the existing clusters which can be joined
+
+    Returns:
+        | list          -- the clusters, as lists of sentence indices
+        | csr_matrix    -- the sums of the clusters' vectors
+    """
+    n, dim = vecs.shape
+    k = len(sizes) if sizes is not None else 0
+
+    # The sums of the clusters' members' similarities to each sentence,
+    # with room for a new cluster per sentence.
+    pairwise = vecs.dot(vecs.T).toarray()
+    sims = np.zeros((k + n, n))
+    sizes_ = np.zeros(k + n)
+    joinable_ = np.zeros(k + n, dtype=bool)
+    if k:
+        sims[:k] = centroids.dot(vecs.T).toarray()
+        sizes_[:k], joinable_[:k] = sizes, joinable
+    sizes, joinable = sizes_, joinable_
+    clusters = [[] for c in range(k)]
+    labels = np.zeros(n, dtype=int)
+
+    for i in range(n):
+        k = len(clusters)
+        c = None
+        if not empty[i] and k:
+            avg_sims = np.where(joinable[:k], sims[:k, i]/sizes[:k], -np.inf)
+
+            # The last of the most similar clusters.
+            best = k - 1 - np.argmax(avg_sims[::-1])
+            if avg_sims[best] >= min_sim:
+                c = best
+
+        if c is None:
+            c = k
+            clusters.append([])
+            joinable[c] = not empty[i]
+
+        clusters[c].append(i)
+        labels[i] = c
+        sizes[c] += 1
+        sims[c] += pairwise[i]
+
+    # The sums of the clusters' vectors.
+    members = csr_matrix((np.ones(n), (labels, np.arange(n))), shape=(len(clusters), n))
+    summed = members.dot(vecs)
+    if centroids is not None and centroids.shape[0]:
+        summed = summed + vstack([centroids, csr_matrix((len(clusters) - centroids.shape[0], dim))], format='csr')
+
+    return clusters, summed.tocsr()
+
+
+def score(sentences, title_words, keywords, tokens=None):
     """
     Score sentences based on their features.
 
+    The features are computed for all the sentences at once,
+    over their tokens flattened into one array.
+
     Args:
         | sentences (list)      -- list of sentences to score
         | title_words (list)    -- list of words in the title
         | keywords (list)       -- list of keywords from the document
+        | tokens (list)         -- the tokens of each sentence, if they are already tokenized (see `Sentences`)
     """
+    if tokens is None:
+        tokens = [tokenize(s) for s in sentences]
+
     num_sentences = len(sentences)
     ranks = Counter()
-    for i, s in enumerate(sentences):
-        sentence = tokenize(s)
-
-        # Calculate features.
-        title_score = score_title(title_words, sentence)
-        s_length = sentence_length(sentence)
-        s_position = sentence_position(i+1, num_sentences)
-        sbs_feature = sbs(sentence, keywords)
-        dbs_feature = dbs(sentence, keywords)
-        frequency = (sbs_feature + dbs_feature) / 2.0 * 10.0
-
-        # Weighted average of feature scores.
-        total_score = (title_score*1.5 + frequency*2.0 +
-                      s_length*1.0 + s_position*1.0) / 4.0
+    if not num_sentences:
+        return ranks
+
+    # Flatten the sentences' tokens, keeping track of
+    # which sentence each token is from, and where in it.
+    lengths = np.array([len(t) for t in tokens])
+    sent_ids = np.repeat(np.arange(num_sentences), lengths)
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(len(sent_ids)) - starts[sent_ids]
+
+    # Map tokens to ids, and look up their keyword scores.
+    vocab = {}
+    token_ids = np.array([vocab.setdefault(w, len(vocab)) for w in chain.from_iterable(tokens)], dtype=int)
+    keyword_scores = np.zeros(len(vocab))
+    in_title = np.zeros(len(vocab), dtype=bool)
+    for w, i in vocab.items():
+        keyword_scores[i] = keywords.get(w, 0)
+        in_title[i] = w in title_words
+    is_keyword = np.array([w in keywords for w in vocab], dtype=bool)[token_ids] if vocab else np.zeros(0, dtype=bool)
+
+    # Calculate features.
+    title_score = np.bincount(sent_ids, weights=in_title[token_ids], minlength=num_sentences)/len(title_words) if title_words else np.zeros(num_sentences)
+    s_length = 1 - np.abs(IDEAL_WORDS - lengths)/IDEAL_WORDS
+    s_position = sentence_positions(num_sentences)
+    sbs_feature = sbs(lengths, sent_ids, keyword_scores[token_ids])
+    dbs_feature = dbs(lengths, sent_ids[is_keyword], positions[is_keyword], token_ids[is_keyword], keyword_scores[token_ids[is_keyword]])
+    frequency = (sbs_feature + dbs_feature) / 2.0 * 10.0
+
+    # Weighted average of feature scores.
+    total_scores = (title_score*1.5 + frequency*2.0 +
+                    s_length*1.0 + s_position*1.0) / 4.0
+    for s, total_score in zip(sentences, total_scores.tolist()):
         ranks[s] = total_score
     return ranks
 
 
-def sbs(words, keywords):
-    score = 0.0
-    if not words:
-        return 0
-    for word in words:
-        if word in keywords:
-            score += keywords[word]
-    return (1.0 / fabs(len(words)) * score)/10.0
+def sbs(lengths, sent_ids, scores):
+    """
+    Summation-based selection: the average keyword score of each sentence's words
+    (over 10).
+
+    Args:
+        | lengths (array)   -- the number of words in each sentence
+        | sent_ids (array)  -- the sentence of each word
+        | scores (array)    -- the keyword score of each word (0 for non-keywords)
+    """
+    totals = np.bincount(sent_ids, weights=scores, minlength=len(lengths))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(lengths > 0, (1.0 / lengths * totals)/10.0, 0.)
 
 
-def dbs(words, keywords):
-    if not words:
-        return 0
+def dbs(lengths, sent_ids, positions, token_ids, scores):
+    """
+    Density-based selection: sums the products of the scores of each sentence's
+    consecutive keywords, over the square of the distance between them,
+    normalized by the number of distinct keywords in the sentence.
 
-    summ = 0
-    first = []
-    second = []
+    Args:
+        | lengths (array)   -- the number of words in each sentence
+        | sent_ids (array)  -- the sentence of each keyword occurrence
+        | positions (array) -- the position of each keyword occurrence in its sentence
+        | token_ids (array) -- the token id of each keyword occurrence
+        | scores (array)    -- the keyword score of each keyword occurrence
+    """
+    num_sentences = len(lengths)
 
-    for i, word in enumerate(words):
-        if word in keywords:
-            score = keywords[word]
-            if first == []:
-                first = [i, score]
-            else:
-                second = first
-                first = [i, score]
-                dif = first[0] - second[0]
-                summ += (first[1]*second[1]) / (dif ** 2)
+    # Pairs of consecutive keywords in the same sentence.
+    pairs = sent_ids[1:] == sent_ids[:-1]
+    dist = (positions[1:] - positions[:-1])[pairs]
+    summ = np.bincount(sent_ids[1:][pairs],
+                       weights=(scores[1:] * scores[:-1])[pairs] / (dist ** 2),
+                       minlength=num_sentences)
 
     # number of intersections
-    k = len(set(keywords.keys()).intersection(set(words))) + 1
-    return (1/(k*(k+1.0))*summ)
+    stride = token_ids.max() + 1 if len(token_ids) else 1
+    distinct = np.unique(sent_ids * stride + token_ids) // stride
+    k = np.bincount(distinct, minlength=num_sentences) + 1
+    return np.where(lengths > 0, 1/(k*(k+1.0))*summ, 0.)
 
 
-def keywords(text):
+def keywords(text, tokens=None):
     """
     Gets the top 10 keywords and their frequency scores
     from a document.
     Sorts them in descending order by number of occurrences.
+
+    Args:
+        | text (str)        -- the document
+        | tokens (iterable) -- the document's tokens, if it is already tokenized (see `Sentences`)
     """
     from operator import itemgetter  # for sorting
 
-    text = sub(r'[^\w ]', '', text)  # strip special chars
-    text_with_stops = [x.strip('.').lower() for x in text.split()]
-
-    numWords = len(text_with_stops)
-    text = tokenize(text)
-    freq = Counter()
-    for word in text:
-        freq[word] += 1
+    text = strip_special(text)  # strip special chars
+    numWords = len(text.split())
+    if tokens is None:
+        tokens = tokenize(text)
+    freq = Counter(tokens)
 
     minSize = min(10, len(freq))
     keywords = tuple(freq.most_common(minSize))  # get first 10
@@ -219,48 +616,14 @@ def keywords(text):
     return dict(keywords)
 
 
-def sentence_length(sentence):
-    """
-    Scores a sentence based on its length.
-    """
-    return 1 - fabs(IDEAL_WORDS - len(sentence)) / IDEAL_WORDS
-
+# The scores of sentences by their (relative) position in a document,
+# for the positions up to each bound.
+POSITION_BOUNDS = np.array([0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0])
+POSITION_SCORES = np.array([0.17, 0.23, 0.14, 0.08, 0.05, 0.04, 0.06, 0.04, 0.04, 0.15, 0])
 
-def score_title(title, sentence):
+def sentence_positions(size):
     """
-    Scores a sentence by its similarity
-    to the document title.
+    Scores the sentences of a document based on their positions.
     """
-    intersect = [word for word in sentence if word in title]
-    return len(intersect)/len(title)
-
-
-def sentence_position(i, size):
-    """
-    Scores a sentence based on its position
-    in a document.
-    """
-
-    normalized = i*1.0 / size
-    if normalized > 0 and normalized <= 0.1:
-        return 0.17
-    elif normalized > 0.1 and normalized <= 0.2:
-        return 0.23
-    elif normalized > 0.2 and normalized <= 0.3:
-        return 0.14
-    elif normalized > 0.3 and normalized <= 0.4:
-        return 0.08
-    elif normalized > 0.4 and normalized <= 0.5:
-        return 0.05
-    elif normalized > 0.5 and normalized <= 0.6:
-        return 0.04
-    elif normalized > 0.6 and normalized <= 0.7:
-        return 0.06
-    elif normalized > 0.7 and normalized <= 0.8:
-        return 0.04
-    elif normalized > 0.8 and normalized <= 0.9:
-        return 0.04
-    elif normalized > 0.9 and normalized <= 1.0:
-        return 0.15
-    else:
-        return 0
+    normalized = np.arange(1, size + 1)*1.0 / size
+    return POSITION_SCORES[np.searchsorted(POSITION_BOUNDS, normalized)]
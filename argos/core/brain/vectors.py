@@ -0,0 +1,111 @@
+"""
+Vectors
+==============
+
+Builds the vector representations
+of articles which are used for clustering.
+
+Article vectors are cached (see `argos.core.models.article.ArticleVector`),
+tagged with the version of the vectorizing pipeline which produced them.
+Retraining the pipeline changes the version, which invalidates the cache.
+"""
+
+import os
+from hashlib import sha1
+from itertools import chain
+from multiprocessing import cpu_count
+
+# billiard is Celery's fork of multiprocessing;
+# unlike multiprocessing, its pools can be started
+# from within (daemonic) Celery worker processes.
+from billiard import Pool
+
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from galaxy import vectorize, concept_vectorize
+
+from argos.conf import APP
+conf = APP['CLUSTERING']
+
+# The versions of pipeline files, by their path, modification time and size,
+# so a pipeline is only hashed again when it changes.
+_versions = {}
+
+def pipeline_version():
+    """
+    Returns the version of the current vectorizing pipeline,
+    which is the hash of its file (`conf['pipeline_path']`),
+    so every host with the same pipeline agrees on it.
+    If there's no pipeline yet, returns '0'.
+    """
+    path = os.path.expanduser(conf['pipeline_path'])
+    if not os.path.exists(path):
+        return '0'
+
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _versions:
+        digest = sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                digest.update(chunk)
+        _versions[key] = digest.hexdigest()
+    return _versions[key]
+
+def vectorize_article(text, concept_slugs):
+    """
+    Builds the normalized (unweighted) bag-of-words
+    and concept vectors for an article.
+
+    Args:
+        | text (str)            -- the article text
+        | concept_slugs (list)  -- the slugs of the article's concepts
+
+    Returns:
+        | tuple -- (bow vector, concept vector), as 1-row CSR matrices
+    """
+    bow_vec = normalize(csr_matrix(vectorize(text), dtype=float), copy=False)
+    con_vec = normalize(csr_matrix(concept_vectorize(concept_slugs), dtype=float), copy=False)
+    return bow_vec, con_vec
+
+def vectorize_articles(docs, processes=None, chunk_size=None):
+    """
+    Builds the normalized bow and concept vectors
+    for a batch of articles.
+
+    The batch is split into chunks which are vectorized
+    over a process pool (sized to the host's cores by default).
+    Small batches, which fit in a single chunk, are vectorized
+    in this process to avoid the pool's overhead.
+
+    Each document goes through `vectorize_article`, so the
+    results are identical to vectorizing articles one at a time.
+
+    Args:
+        | docs (list)           -- list of (text, concept slugs) tuples
+        | processes (int)       -- number of worker processes (default=conf['vectorize_processes'] or the number of cores)
+        | chunk_size (int)      -- number of documents per chunk (default=conf['vectorize_chunk_size'])
+
+    Returns:
+        | list -- list of (bow vector, concept vector) tuples, in the same order as `docs`
+    """
+    processes = processes or conf['vectorize_processes'] or cpu_count()
+    chunk_size = chunk_size or conf['vectorize_chunk_size']
+
+    chunks = [docs[i:i+chunk_size] for i in range(0, len(docs), chunk_size)]
+    if len(chunks) <= 1 or processes <= 1:
+        return list(chain.from_iterable(map(vectorize_chunk, chunks)))
+
+    pool = Pool(processes=min(processes, len(chunks)))
+    try:
+        results = pool.map(vectorize_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    return list(chain.from_iterable(results))
+
+def vectorize_chunk(docs):
+    """
+    Vectorizes a chunk of (text, concept slugs) tuples.
+    """
+    return [vectorize_article(text, concept_slugs) for text, concept_slugs in docs]
@@ -9,9 +9,17 @@ articles for training and/or testing.
 from argos.datastore import db
 from argos.core.models import Article
 from argos.core.membrane import evaluator, extractor
+from argos.util.request import make_request
+from argos.conf import APP
 
+from time import time
+from hashlib import sha1
 from dateutil.parser import parse
 from urllib import error
+from urllib.parse import urlparse
+from threading import Lock, BoundedSemaphore
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import feedparser
 from ftfy import fix_text_segment
 
@@ -22,29 +30,42 @@ from http.client import BadStatusLine
 from argos.util.logger import logger
 logger = logger(__name__)
 
+conf = APP['COLLECTING']
+
 def collect(feed):
     """
     Fetch articles from the specified feed,
     and save to db.
-    """
 
+    If the feed can't be parsed or responds with an HTTP error (e.g. 404),
+    this is noted as one of the feed's errors rather than raised,
+    so it is tried again next collection cycle instead of on every run.
+
+    Returns what was saved if the feed was unchanged (see `fetch_feed`), or None.
+    """
+    saved = None
     try:
         logger.info('Fetching from {0}...'.format(feed.ext_url))
 
         def commit_article(article):
+            # Vectorize at ingest time so the vectors
+            # are cached by the time the article is clustered.
+            article.vectorize()
             db.session.add(article)
 
-        get_articles(feed, commit_article)
+        saved = get_articles(feed, commit_article)
         db.session.commit()
 
-    except SAXException as e:
+    except (SAXException, error.HTTPError) as e:
         # Error with the feed, make a note.
-        logger.info('Error fetching from {0}.'.format(feed.ext_url))
+        logger.info('Error fetching from {0}: {1}'.format(feed.ext_url, e))
         feed.errors += 1
         db.session.commit()
 
+    return saved
+
 
-def get_articles(feed, fn):
+def get_articles(feed, fn, workers=None, per_host=None):
     """
     Parse the specified feed,
     gathering the latest new articles.
@@ -62,12 +83,33 @@ def get_articles(feed, fn):
     date in their entry data. In which case, it is left as an
     empty string.
 
+    If the feed hasn't changed since it was last collected,
+    it isn't parsed at all (see `fetch_feed`). If any of its entries
+    couldn't be reached, it is parsed again next time, so they are retried.
+
+    The entries are fetched, and their images saved and their articles scored,
+    over a pool of threads, at most `per_host` from the same host at once.
+    Everything which touches the database (checking for existing articles,
+    extracting authors, and `fn`) stays in the calling thread, on its session.
+    The results are still handled in the order of the feed's entries,
+    so which duplicate is kept, and the order of the articles, doesn't depend on timing.
+
     Args:
         | feed (Feed)    -- the feed to fetch from.
         | fn (Callable)  -- function to use an article
+        | workers (int)  -- the number of threads (default=conf['fetch_workers'])
+        | per_host (int) -- the most requests to one host at once (default=conf['fetch_per_host'])
+
+    Returns:
+        | dict -- the bytes and parse time saved if the feed was unchanged (see `fetch_feed`), or None
     """
+    workers = workers or conf['fetch_workers']
+    per_host = per_host or conf['fetch_per_host']
+
     # Fetch the feed data.
-    data = feedparser.parse(feed.ext_url)
+    data, validators, saved = fetch_feed(feed)
+    if data is None:
+        return saved
 
     # If the `bozo` value is anything
     # but 0, there was an error parsing (or connecting) to the feed.
@@ -76,63 +118,192 @@ def get_articles(feed, fn):
         if not isinstance(data.bozo_exception, feedparser.CharacterEncodingOverride) and not isinstance(data.bozo_exception, feedparser.NonXMLContentType):
             raise data.bozo_exception
 
+    # URLs for the entries, skipping those of existing Articles,
+    # which are all checked for in one query.
+    urls = OrderedDict()
     for entry in data.entries:
+        urls.setdefault(entry['links'][0]['href'], entry)
+    existing = set()
+    if urls:
+        existing = set(url for url, in db.session.query(Article.ext_url).filter(Article.ext_url.in_(list(urls.keys()))))
+    entries = [(url, entry) for url, entry in urls.items() if url not in existing]
 
-        # URL for this entry.
-        url = entry['links'][0]['href']
+    limit = HostLimiter(per_host)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Complete HTML content for the entries.
+        fetches = [(pool.submit(fetch_entry, url, limit), url, entry) for url, entry in entries]
 
-        # Check for an existing Article.
-        # If one exists, skip.
-        if Article.query.filter_by(ext_url=url).count():
-            continue
+        enrichments = []
+        titles = set()
+        unreachable = 0
+        for future, url, entry in fetches:
+            entry_data, html, reached = future.result()
+            if not reached:
+                unreachable += 1
+            if entry_data is None:
+                continue
 
-        # Complete HTML content for this entry.
-        try:
-            entry_data, html = extractor.extract_entry_data(url)
-        except (error.HTTPError, error.URLError, ConnectionResetError, BadStatusLine) as e:
-            if type(e) == error.URLError or e.code == 404:
-                # Can't reach, skip.
-                logger.exception('Error extracting data for url {0}'.format(url))
+            url = entry_data.canonical_link or url
+            published = parse(entry.get('published')) if entry.get('published') else entry_data.publish_date
+            updated = parse(entry.get('updated')) if entry.get('updated') else published
+            title = entry.get('title', entry_data.title)
+
+            # Secondary check for an existing Article,
+            # by checking the title and source
+            # (including this feed's other entries).
+            if title in titles:
                 continue
-            else:
-                # Just skip so things don't break!
-                logger.exception('Error extracting data for url {0}'.format(url))
+            existing = Article.query.filter_by(title=title).first()
+            if existing and existing.source == feed.source:
                 continue
+            titles.add(title)
+
+            future = pool.submit(enrich_entry, entry_data, url, limit)
+            enrichments.append((future, entry, entry_data, html, url, published, updated, title))
+
+        for future, entry, entry_data, html, url, published, updated, title in enrichments:
+            image_url, score = future.result()
+
+            fn(Article(
+                ext_url=url,
+                source=feed.source,
+                feed=feed,
+                html=html,
+                text=fix_text_segment(entry_data.cleaned_text),
+                authors=extractor.extract_authors(entry),
+                tags=extractor.extract_tags(entry, known_tags=entry_data.tags),
+                title=fix_text_segment(title),
+                created_at=published,
+                updated_at=updated,
+                image=image_url,
+                score=score
+            ))
+
+    # Only remember what was collected once all of its entries have been,
+    # so that if collecting fails, the feed is parsed again next time.
+    if unreachable:
+        logger.info('{0} entries of feed {1} could not be reached, it will be parsed again next time.'.format(unreachable, feed.ext_url))
+        return
+    for key, value in validators.items():
+        setattr(feed, key, value)
+
+
+def fetch_feed(feed):
+    """
+    Fetches and parses a feed, unless it is unchanged since it was last collected.
+
+    The request is conditional on the feed's ETag and Last-Modified validators,
+    so servers which support them respond with a bodiless 304 Not Modified.
+    Otherwise, if the body's hash is the same as the last one collected, it isn't parsed again.
+    What was saved (by the size of the last body and how long it took to parse) is logged.
+
+    Returns:
+        | data (FeedParserDict) -- the parsed feed, or None if it is unchanged
+        | validators (dict)     -- the feed's new validators, hash, body size and parse time,
+                                   to be set on the feed once it is collected
+        | saved (dict)          -- the bytes not downloaded and the seconds of parsing saved,
+                                   or None if it was parsed
+    """
+    headers = {'User-Agent': 'Chrome'}
+    if feed.etag:
+        headers['If-None-Match'] = feed.etag
+    if feed.last_modified:
+        headers['If-Modified-Since'] = feed.last_modified
+
+    try:
+        res = make_request(feed.ext_url, headers=headers)
+    except error.HTTPError as e:
+        if e.code != 304:
+            raise
+        saved = {'bytes': feed.content_length or 0, 'parse_time': feed.parse_time or 0}
+        logger.info('Feed {0} not modified, saved {bytes} bytes and {parse_time:.3f}s of parsing.'.format(feed.ext_url, **saved))
+        return None, {}, saved
+
+    # `make_request` gives up without raising once it runs out of retries.
+    if res is None:
+        raise error.URLError('Could not reach feed {0}'.format(feed.ext_url))
+
+    body = res.read()
+    validators = {
+        'etag': res.headers.get('ETag'),
+        'last_modified': res.headers.get('Last-Modified'),
+        'content_hash': sha1(body).hexdigest(),
+        'content_length': len(body)
+    }
+    if validators['content_hash'] == feed.content_hash:
+        saved = {'bytes': 0, 'parse_time': feed.parse_time or 0}
+        logger.info('Feed {0} unchanged, saved {parse_time:.3f}s of parsing.'.format(feed.ext_url, **saved))
+        feed.etag, feed.last_modified = validators['etag'], validators['last_modified']
+        return None, {}, saved
+
+    start_time = time()
+    data = feedparser.parse(body, response_headers=dict(res.headers.items()))
+    validators['parse_time'] = time() - start_time
+    return data, validators, None
+
+
+def fetch_entry(url, limit):
+    """
+    Fetches and extracts an entry's full content (see `extractor.extract_entry_data`).
+    Runs in a worker thread, so it must not touch the database.
+
+    Returns:
+        | entry_data    -- the extracted data, or None if it can't be reached or is too short
+        | html (str)    -- the entry's html, or None
+        | reached (bool)    -- False if it couldn't be reached for now (i.e. not a 4xx error),
+                               so it is worth trying again later
+    """
+    try:
+        with limit(url):
+            entry_data, html = extractor.extract_entry_data(url)
+    except (error.HTTPError, error.URLError, ConnectionResetError, BadStatusLine) as e:
+        # Can't reach, just skip so things don't break!
+        logger.exception('Error extracting data for url {0}'.format(url))
+        # A 4xx error means the entry is gone for good, so it isn't worth trying again,
+        # but anything else may just be temporary.
+        reached = isinstance(e, error.HTTPError) and 400 <= e.code < 500
+        return None, None, reached
+
+    # Skip over entries that are too short.
+    if entry_data is None or len(entry_data.cleaned_text) < 400:
+        return None, None, True
+
+    return entry_data, html, True
+
+
+def enrich_entry(entry_data, url, limit):
+    """
+    Downloads and saves the top image of an entry,
+    and scores it. Returns (image url, score).
+    Each request is limited by the host it is made to,
+    i.e. the image's host and the scoring services.
+    Runs in a worker thread, so it must not touch the database.
+    """
+    image_url = extractor.extract_image(entry_data, filename=hash(url), limit=limit)
+    return image_url, evaluator.score(url, limit=limit)
+
+
+class HostLimiter():
+    """
+    Limits how many requests are made to the same host at once,
+    so that fetching a feed's entries concurrently doesn't hammer its site,
+    or the hosts of their images and the scoring services.
+    It is keyed on the host of the url actually being requested.
+
+    Example::
+
+        limit = HostLimiter(4)
+        with limit(url):
+            ...
+    """
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self.lock = Lock()
+        self.semaphores = {}
 
-        if entry_data is None:
-            continue
-
-        full_text = entry_data.cleaned_text
-
-        # Skip over entries that are too short.
-        if len(full_text) < 400:
-            continue
-
-        url = entry_data.canonical_link or url
-        published = parse(entry.get('published')) if entry.get('published') else entry_data.publish_date
-        updated = parse(entry.get('updated')) if entry.get('updated') else published
-        title = entry.get('title', entry_data.title)
-
-        # Secondary check for an existing Article,
-        # by checking the title and source.
-        existing = Article.query.filter_by(title=title).first()
-        if existing and existing.source == feed.source:
-            continue
-
-        # Download and save the top article image.
-        image_url = extractor.extract_image(entry_data, filename=hash(url))
-
-        fn(Article(
-            ext_url=url,
-            source=feed.source,
-            feed=feed,
-            html=html,
-            text=fix_text_segment(full_text),
-            authors=extractor.extract_authors(entry),
-            tags=extractor.extract_tags(entry, known_tags=entry_data.tags),
-            title=fix_text_segment(title),
-            created_at=published,
-            updated_at=updated,
-            image=image_url,
-            score=evaluator.score(url)
-        ))
+    def __call__(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
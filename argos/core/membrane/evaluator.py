@@ -17,9 +17,13 @@ from argos.util.request import make_request
 from argos.util.logger import logger
 logger = logger(__name__)
 
-def _request(endpoint, url, format='json'):
+def _request(endpoint, url, format='json', limit=None):
     complete_url = '{0}{1}'.format(endpoint, url)
-    res = make_request(complete_url)
+    if limit is None:
+        res = make_request(complete_url)
+    else:
+        with limit(complete_url):
+            res = make_request(complete_url)
     content = res.read()
     if format == 'json':
         return json.loads(content.decode('utf-8'))
@@ -27,7 +31,7 @@ def _request(endpoint, url, format='json'):
         return xmltodict.parse(content)
     return None
 
-def facebook_graph(url):
+def facebook_graph(url, limit=None):
     """
     Response/Returns::
 
@@ -40,13 +44,13 @@ def facebook_graph(url):
     Returns total shares (i.e. likes, shares, and comments) plus the external comments.
     """
     try:
-        data = _request('https://graph.facebook.com/', url)
+        data = _request('https://graph.facebook.com/', url, limit=limit)
         return data['comments'] + data['shares']
     except error.HTTPError as e:
         logger.exception('Error getting score for `facebook_graph` ({0}): {1}'.format(url, e))
         return 0
 
-def facebook(url):
+def facebook(url, limit=None):
     """
     Response::
 
@@ -91,7 +95,7 @@ def facebook(url):
     """
 
     try:
-        data = _request('https://api.facebook.com/restserver.php?method=links.getStats&urls=', url, format='xml')
+        data = _request('https://api.facebook.com/restserver.php?method=links.getStats&urls=', url, format='xml', limit=limit)
         data_ = dict(data['links_getStats_response']['link_stat'])
         return int(data_['click_count'])/4 + int(data_['total_count']) + int(data_['commentsbox_count'])
     except (error.HTTPError, KeyError) as e:
@@ -99,7 +103,7 @@ def facebook(url):
         return 0
 
 
-def twitter(url):
+def twitter(url, limit=None):
     """
     Response/Returns::
 
@@ -118,7 +122,7 @@ def twitter(url):
     retries = 0
     while retries < 5:
         try:
-            data = _request('https://cdn.api.twitter.com/1/urls/count.json?url=', url)
+            data = _request('https://cdn.api.twitter.com/1/urls/count.json?url=', url, limit=limit)
             return int(data.get('count', 0))
 
         except error.HTTPError as e:
@@ -133,7 +137,7 @@ def twitter(url):
     return 0
 
 
-def linkedin(url):
+def linkedin(url, limit=None):
     """
     Response::
 
@@ -147,14 +151,14 @@ def linkedin(url):
     Returns the count.
     """
     try:
-        data = _request('https://www.linkedin.com/countserv/count/share?format=json&url=', url)
+        data = _request('https://www.linkedin.com/countserv/count/share?format=json&url=', url, limit=limit)
         return int(data['count'])
     except (error.HTTPError, ValueError) as e:
         logger.exception('Error getting score for `linkedin` ({0}): {1}'.format(url, e))
         return 0
 
 
-def stumbleupon(url):
+def stumbleupon(url, limit=None):
     """
     Response::
 
@@ -178,12 +182,20 @@ def stumbleupon(url):
     Returns the view count.
     """
     try:
-        data = _request('http://www.stumbleupon.com/services/1.01/badge.getinfo?url=', url)
+        data = _request('http://www.stumbleupon.com/services/1.01/badge.getinfo?url=', url, limit=limit)
         return int(data.get('result', {}).get('views', 0))
     except error.HTTPError as e:
         logger.exception('Error getting score for `stumbleupon` ({0}): {1}'.format(url, e))
         return 0
 
 
-def score(url):
-    return round(stumbleupon(url) + linkedin(url) + facebook(url) + twitter(url))
+def score(url, limit=None):
+    """
+    Scores an article by its shares on a few social networks.
+
+    Args:
+        | url (str)     -- the article's url
+        | limit         -- optional callable mapping a url to a context manager to make its request in,
+                           e.g. a `collector.HostLimiter`
+    """
+    return round(stumbleupon(url, limit) + linkedin(url, limit) + facebook(url, limit) + twitter(url, limit))
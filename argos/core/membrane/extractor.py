@@ -60,13 +60,16 @@ def extract_tags(entry, known_tags=None):
 
     return list(set(tags))
 
-def extract_image(entry_data, filename):
+def extract_image(entry_data, filename, limit=None):
     """
     Extracts and saves a representative
     image for the entry.
 
     This preserves the file extension of the remote file,
     preferencing it over the one specified by the user.
+
+    The image is downloaded within `limit(remote image url)`, if given
+    (e.g. a `collector.HostLimiter`).
     """
     image_url = None
     if entry_data.top_image:
@@ -75,7 +78,12 @@ def extract_image(entry_data, filename):
         # Occasionally this url comes back as empty.
         if remote_image_url:
             ext = splitext(remote_image_url)[-1].lower()
-            image_url = storage.save_from_url(remote_image_url, '{0}{1}'.format(filename, ext))
+            filename = '{0}{1}'.format(filename, ext)
+            if limit is None:
+                image_url = storage.save_from_url(remote_image_url, filename)
+            else:
+                with limit(remote_image_url):
+                    image_url = storage.save_from_url(remote_image_url, filename)
     return image_url
 
 def extract_authors(entry):
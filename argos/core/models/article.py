@@ -1,7 +1,8 @@
-from argos.datastore import db, join_table
+from argos.datastore import db, join_table, Model
 from argos.core.models.concept import Concept, Alias, BaseConceptAssociation
 from argos.core.models.cluster import Clusterable
 from argos.core import knowledge
+from argos.core.brain import vectors
 
 import galaxy as gx
 
@@ -23,6 +24,18 @@ class ArticleConceptAssociation(BaseConceptAssociation):
     __backref__ = 'article_associations'
     article_id  = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)
 
+class ArticleVector(Model):
+    """
+    The cached vector representations of an article,
+    tagged with the version of the vectorizing pipeline
+    which produced them.
+    """
+    __tablename__ = 'article_vector'
+    article_id  = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)
+    version     = db.Column(db.String)
+    bow         = db.Column(db.PickleType)
+    concepts    = db.Column(db.PickleType)
+
 class Article(Clusterable):
     """
     An article.
@@ -39,10 +52,14 @@ class Article(Clusterable):
     score       = db.Column(db.Float, default=0.0)
     source_id   = db.Column(db.Integer, db.ForeignKey('source.id'))
     feed_id     = db.Column(db.Integer, db.ForeignKey('feed.id'))
-    node_id     = db.Column(db.Integer, unique=True, index=True)
+    node_id     = db.Column(db.BigInteger, unique=True, index=True)
     authors     = db.relationship('Author',
                     secondary=articles_authors,
                     backref=db.backref('articles', lazy='dynamic'))
+    vector      = db.relationship('ArticleVector',
+                    uselist=False,
+                    cascade='all, delete-orphan',
+                    backref='article')
 
     # There are some articles which are just noise, and we want to ignore them using regexes for their titles.
     ignore_patterns = [
@@ -126,6 +143,23 @@ class Article(Clusterable):
 
         self.concept_associations = assocs
 
+    def vectorize(self, version=None):
+        """
+        Returns this article's (bow, concept) vectors.
+
+        They are computed and cached the first time,
+        and recomputed only if they were built by an
+        outdated version of the vectorizing pipeline.
+        """
+        if version is None:
+            version = vectors.pipeline_version()
+
+        if self.vector is None or self.vector.version != version:
+            bow, concepts = vectors.vectorize_article(self.text, self.concept_slugs)
+            self.vector = ArticleVector(version=version, bow=bow, concepts=concepts)
+
+        return self.vector.bow, self.vector.concepts
+
     @property
     def published(self):
         """Convert datetime to seconds"""
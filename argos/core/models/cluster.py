@@ -1,11 +1,158 @@
 from argos.datastore import db, Model
+from argos.core.brain import summarizer
 from argos.core.brain.summarizer import summarize, multisummarize
 
+from sqlalchemy import func, bindparam
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.dialects.postgresql import JSON
 
+from hashlib import sha1
 from datetime import datetime
 from itertools import chain, groupby
 
+# Bump this to invalidate cached summaries,
+# e.g. when the summarizer changes what it outputs.
+SUMMARY_CACHE_VERSION = 1
+
+class SummaryCache(Model):
+    """
+    Cached cluster summaries, keyed by a hash of
+    what the summaries were built from (see `summary_key`),
+    so re-summarizing the same members is a lookup.
+
+    A summary is cached as its sentences, each with the index of the
+    member it was selected from (or None), so cached summaries
+    can be attributed to their members too (see `Event.summarize`).
+
+    The cache is shared by all workers. It is written through its own
+    connection, outside of the session's transaction, so that two workers
+    caching the same summary at once don't break each other's transactions.
+
+    Each entry counts how many times it was reused, and when it was last used,
+    so that the least recently used entries can be evicted (see `evict`).
+    """
+    __tablename__ = 'summary_cache'
+    key         = db.Column(db.String(40), primary_key=True)
+    summary     = db.Column(db.UnicodeText)
+    sentences   = db.Column(JSON)
+    hits        = db.Column(db.Integer, default=0)
+    used_at     = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @classmethod
+    def lookup(cls, key):
+        """
+        Returns the cached summary sentences for a key, or None if there isn't one.
+        """
+        return cls.lookup_many([key]).get(key)
+
+    @classmethod
+    def store(cls, key, sentences):
+        """
+        Caches a summary's (sentence, member index) pairs.
+        """
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(cls.__table__.insert().values(**cls.entry(key, sentences, datetime.utcnow())))
+        except IntegrityError:
+            # Another worker cached it meanwhile.
+            pass
+
+    @classmethod
+    def lookup_many(cls, keys):
+        """
+        Returns a dict of the cached summary sentences for those of `keys` which have them.
+        """
+        if not keys:
+            return {}
+        summaries = dict(db.session.query(cls.key, cls.sentences).filter(cls.key.in_(list(keys)), cls.sentences != None))
+        if summaries:
+            table = cls.__table__
+            with db.engine.begin() as conn:
+                conn.execute(table.update().where(table.c.key.in_(list(summaries.keys()))).values(hits=table.c.hits + 1, used_at=datetime.utcnow()))
+        return {key: [tuple(pair) for pair in sentences] for key, sentences in summaries.items()}
+
+    @classmethod
+    def store_many(cls, summaries):
+        """
+        Caches a dict of summaries' (sentence, member index) pairs by their keys.
+        """
+        if not summaries:
+            return
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(cls.__table__.insert(), [cls.entry(key, sentences, now) for key, sentences in summaries.items()])
+        except IntegrityError:
+            # Another worker cached some of them meanwhile.
+            for key, sentences in summaries.items():
+                cls.store(key, sentences)
+
+    @staticmethod
+    def entry(key, sentences, now):
+        return {
+            'key': key,
+            'summary': join_sentences(sentences),
+            'sentences': [list(pair) for pair in sentences],
+            'hits': 0,
+            'used_at': now
+        }
+
+    @classmethod
+    def evict(cls, max_entries):
+        """
+        Evicts the least recently used entries,
+        keeping at most `max_entries`. Returns how many were evicted.
+        """
+        cutoff = db.session.query(cls.used_at).order_by(cls.used_at.desc()).offset(max_entries).limit(1).scalar()
+        if cutoff is None:
+            return 0
+        evicted = cls.query.filter(cls.used_at <= cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return evicted
+
+    @classmethod
+    def stats(cls):
+        """
+        Returns the cache's size and hit rate.
+
+        Every entry was built on a miss, so the hit rate is
+        the entries' hits over their hits and misses.
+        Evicted entries no longer count.
+        """
+        entries, hits = db.session.query(func.count(cls.key), func.coalesce(func.sum(cls.hits), 0)).one()
+        return {
+            'entries': entries,
+            'hits': hits,
+            'misses': entries,
+            'hit_rate': hits/(hits + entries) if entries else 0.
+        }
+
+def summary_key(kind, parts):
+    """
+    Hashes what a summary is built from into a cache key.
+
+    Args:
+        | kind (str)    -- what is summarized, e.g. 'event'
+        | parts (list)  -- the (ordered) inputs of the summary, which must have a stable `repr`
+    """
+    return sha1(repr((SUMMARY_CACHE_VERSION, kind, parts)).encode('utf-8')).hexdigest()
+
+def join_sentences(sentences):
+    """
+    Joins a summary's (sentence, member index) pairs into its text.
+    """
+    return ' '.join(sent for sent, i in sentences)
+
+def attribute(sentences, sources):
+    """
+    Attributes a summary's (sentence, member index) pairs to
+    the `sources` (dicts) of the members they were selected from,
+    so they can be served as they are. Empty sentences are left out.
+    """
+    unknown = {'source': None, 'url': None}
+    return [dict(sources[i] if i is not None else unknown, sentence=sent) for sent, i in sentences if sent]
+
 class Clusterable(Model):
     """
     An abstract class for anything that can be clustered.
@@ -125,12 +272,114 @@ class Cluster(Clusterable):
         """
         raise NotImplementedError
 
-    def __init__(self, members):
+    def __init__(self, members, update=True):
         """
         Initialize a cluster with some members.
+
+        Set `update=False` to skip summarizing and
+        conceptizing the cluster for now.
         """
         self.members = members
-        self.update()
+        if update:
+            self.update()
+
+    def cached_summary(self, key, build):
+        """
+        Returns the cached summary for `key` (see `SummaryCache`),
+        or builds it with `build` and caches it.
+        The summary is a list of (sentence, member index) pairs,
+        see `argos.core.brain.summarizer.multisummarize`.
+        If `key` is None, the cache is skipped.
+        """
+        if key is None:
+            return build()
+
+        summary = SummaryCache.lookup(key)
+        if summary is None:
+            summary = build()
+            SummaryCache.store(key, summary)
+        return summary
+
+    @classmethod
+    def summary_jobs(cls, ids):
+        """
+        The summarizing jobs for some clusters, see `summarize_all`.
+        Must be implemented on subclasses, otherwise raises NotImplementedError.
+
+        Returns:
+            | jobs (list)       -- the (id, title, texts) jobs for `argos.core.brain.summarizer.summarize_many`
+            | keys (dict)       -- the jobs' cache keys (see `summary_key`), or None for jobs which aren't cached
+            | summaries (dict)  -- the (sentence, member index) pairs of clusters which don't need summarizing
+            | sources (dict)    -- for clusters whose summaries are attributed (see `attribute`), their members' sources
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def summarize_all(cls, ids, processes=None, chunk_size=None, timeout=None):
+        """
+        Summarizes many clusters at once, e.g. when rebuilding them in bulk.
+
+        The clusters' members are loaded in one query, their cached summaries
+        are looked up in another, and the rest are summarized over a process pool
+        (see `argos.core.brain.summarizer.summarize_many`). The summaries
+        are then written back in bulk, so this does not refresh
+        the `members`-dependent state of the clusters (e.g. concepts).
+
+        Clusters which fail or time out are left as they are.
+        This does not commit.
+
+        Returns the ids of the clusters which were summarized.
+        """
+        if not ids:
+            return []
+
+        jobs, keys, summaries, sources = cls.summary_jobs(ids)
+
+        cached = SummaryCache.lookup_many(set(key for key in keys.values() if key is not None))
+        for id, title, texts in jobs:
+            if keys[id] in cached:
+                summaries[id] = cached[keys[id]]
+        jobs = [job for job in jobs if job[0] not in summaries]
+
+        # Keep the sentence clusters of clusters which
+        # can be added to incrementally (see `Event.summarize`).
+        keep_clusters = 'sentence_clusters' in cls.__table__.c
+        built = summarizer.summarize_many(jobs, processes=processes, chunk_size=chunk_size, timeout=timeout, clusters=keep_clusters)
+        for id, (sentences, sent_clusters) in built.items():
+            summaries[id] = sentences
+        SummaryCache.store_many({keys[id]: summaries[id] for id in built if keys[id] is not None})
+
+        if not summaries:
+            return []
+
+        table = cls.__table__
+        values = {'summary': bindparam('_summary')}
+        rows = [{'_id': id, '_summary': join_sentences(sentences)} for id, sentences in summaries.items()]
+        if 'attributions' in table.c:
+            values['attributions'] = bindparam('_attributions')
+            for row in rows:
+                row['_attributions'] = attribute(summaries[row['_id']], sources[row['_id']])
+
+        # Only the clusters which were just summarized have new sentence clusters;
+        # the others (from the cache) keep theirs, so they can still be added to.
+        groups = [(values, rows)]
+        if keep_clusters:
+            built_values = dict(values, sentence_clusters=bindparam('_sentence_clusters'))
+            built_rows = [dict(row, _sentence_clusters=built[row['_id']][1]) for row in rows if row['_id'] in built]
+            groups = [(values, [row for row in rows if row['_id'] not in built]), (built_values, built_rows)]
+
+        for group_values, group_rows in groups:
+            if not group_rows:
+                continue
+            db.session.execute(table.update().where(table.c.id == bindparam('_id')).values(**group_values), group_rows)
+
+            # Loaded clusters would otherwise keep their old summaries.
+            group_ids = set(row['_id'] for row in group_rows)
+            for obj in list(db.session.identity_map.values()):
+                if isinstance(obj, cls) and obj.id in group_ids:
+                    db.session.expire(obj, list(group_values.keys()))
+
+        return list(summaries.keys())
 
     def summarize(self):
         """
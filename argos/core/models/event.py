@@ -1,12 +1,18 @@
 from argos.datastore import db, join_table
-from argos.core.models.cluster import Cluster
+from argos.core.models.article import Article
+from argos.core.models.source import Source
+from argos.core.models.cluster import Cluster, summary_key, join_sentences, attribute
 from argos.core.models.concept import BaseConceptAssociation
 from argos.core.brain import summarizer
 
-from itertools import chain
+from copy import copy
+from itertools import chain, groupby
+from operator import itemgetter
 from datetime import datetime
 from math import log
 from sqlalchemy import event, inspect
+from sqlalchemy.orm import deferred
+from sqlalchemy.dialects.postgresql import JSON
 from nltk.tokenize import sent_tokenize
 
 import galaxy as gx
@@ -27,6 +33,15 @@ class Event(Cluster):
     raw_score       = db.Column(db.Float, default=0.0)
     _score          = db.Column(db.Float, default=0.0)
 
+    # The sentence clusters the summary was selected from
+    # (see `argos.core.brain.summarizer.SentenceClusters`),
+    # so that articles can be added to the summary incrementally.
+    sentence_clusters = deferred(db.Column(db.PickleType))
+
+    # The summary's sentences, attributed to the articles
+    # they were selected from (see `summary_sentences`).
+    attributions    = db.Column(JSON)
+
     @classmethod
     def all_active(cls):
         """
@@ -61,7 +76,14 @@ class Event(Cluster):
         """
         Breaks up a summary back into its
         original sentences (as a list).
+
+        The sentences are attributed when the event is summarized;
+        summaries from before then are attributed here.
         """
+        if not self.summary:
+            return []
+        if self.attributions is not None:
+            return self.attributions
         data = [{'sentence': sent} for sent in sent_tokenize(self.summary)]
         for d in data:
             article = next((a for a in self.members if d['sentence'] in ' '.join([a.title, a.text])), None)
@@ -141,16 +163,81 @@ class Event(Cluster):
     def summarize(self):
         """
         Generate a summary for this cluster.
+
+        The summary is cached by the ids of the event's articles
+        and the times they were last updated, so re-summarizing
+        the same (unchanged) articles is a lookup.
+        Events with unsaved articles are not cached.
+
+        The sentence clusters of the last summary are kept, so if articles
+        were only added since (after the existing ones, in id order),
+        only the new articles' sentences are clustered.
+
+        The summary's sentences are attributed to the articles
+        they were selected from, see `summary_sentences`.
         """
-        if self.members.count() == 1:
-            member = self.members[0]
-            summary_sentences = summarizer.summarize(member.title, member.text)
-            self.summary = ' '.join(summary_sentences)
-        else:
-            summary_sentences = summarizer.multisummarize([m.text for m in self.members])
-            self.summary = ' '.join(summary_sentences)
+        members = list(self.members)
+
+        key = None
+        if all(m.id is not None and m.updated_at is not None for m in members):
+            members.sort(key=lambda m: m.id)
+            key = summary_key('event', [(m.id, m.updated_at.isoformat()) for m in members])
+
+        def build():
+            if len(members) == 1:
+                member = members[0]
+                summary_sentences = [(sent, 0) for sent in summarizer.summarize(member.title, member.text)]
+            else:
+                docs = [m.text for m in members]
+                clusters = self.sentence_clusters
+                if clusters is not None and clusters.extends(docs):
+                    # Copied, so that the change is detected.
+                    clusters = copy(clusters)
+                else:
+                    clusters = summarizer.SentenceClusters()
+                summary_sentences = summarizer.multisummarize(docs, clusters=clusters, sources=True)
+                self.sentence_clusters = clusters
+            return summary_sentences
+
+        summary_sentences = self.cached_summary(key, build)
+        self.summary = join_sentences(summary_sentences)
+        self.attributions = attribute(summary_sentences, [self.source_of(m) for m in members])
         return self.summary
 
+    @staticmethod
+    def source_of(article):
+        """
+        What a summary sentence selected from an article is attributed to.
+        """
+        return {
+            'source': article.source.name if article.source is not None else None,
+            'url': article.ext_url
+        }
+
+    @classmethod
+    def summary_jobs(cls, ids):
+        """
+        The summarizing jobs for events (see `Cluster.summarize_all`),
+        with the same inputs and cache keys as `summarize`.
+        Their articles, and their articles' sources, are loaded in one query.
+        """
+        rows = db.session.query(events_articles.c.event_id, Article.id, Article.updated_at, Article.title, Article.text, Article.ext_url, Source.name)\
+                .join(Article, Article.id == events_articles.c.article_id)\
+                .outerjoin(Source, Source.id == Article.source_id)\
+                .filter(events_articles.c.event_id.in_(list(ids)))\
+                .order_by(events_articles.c.event_id, Article.id)
+
+        jobs, keys, sources = [], {}, {}
+        for id, members in groupby(rows, key=itemgetter(0)):
+            members = list(members)
+            key = None
+            if all(m[2] is not None for m in members):
+                key = summary_key('event', [(m[1], m[2].isoformat()) for m in members])
+            keys[id] = key
+            sources[id] = [{'source': m[6], 'url': m[5]} for m in members]
+            jobs.append((id, members[0][3], [m[4] for m in members]))
+        return jobs, keys, {}, sources
+
 @event.listens_for(Event, 'before_update')
 def receive_before_update(mapper, connection, target):
     # Only make these changes if the articles have changed.
@@ -1,5 +1,7 @@
 from argos.datastore import db, Model
 
+from sqlalchemy import func
+
 from datetime import datetime
 
 class Source(Model):
@@ -26,5 +28,39 @@ class Feed(Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     updating = db.Column(db.Boolean, default=False)
+
+    # To tell if the feed has changed since it was last collected,
+    # see `argos.core.membrane.collector.fetch_feed`.
+    etag = db.Column(db.Unicode)
+    last_modified = db.Column(db.Unicode)
+    content_hash = db.Column(db.String(40))
+    content_length = db.Column(db.Integer)
+    parse_time = db.Column(db.Float)
+
+    # What skipping the feed saved the last time it was collected,
+    # or None if it was parsed.
+    saved_bytes = db.Column(db.Integer)
+    saved_parse_time = db.Column(db.Float)
     articles = db.relationship('Article', backref='feed', lazy='dynamic')
     source_id   = db.Column(db.Integer, db.ForeignKey('source.id'))
+
+    @classmethod
+    def cycle_stats(cls):
+        """
+        Returns what skipping unchanged feeds saved over a collection cycle,
+        i.e. over the last time each feed was collected.
+
+        These are kept on the feeds, rather than tallied by a worker,
+        so they cover what every worker collected.
+        """
+        feeds, skipped, bytes, parse_time = db.session.query(
+                func.count(cls.id),
+                func.count(cls.saved_bytes),
+                func.coalesce(func.sum(cls.saved_bytes), 0),
+                func.coalesce(func.sum(cls.saved_parse_time), 0.)).one()
+        return {
+            'feeds': feeds,
+            'skipped': skipped,
+            'bytes': bytes,
+            'parse_time': parse_time
+        }
@@ -1,10 +1,11 @@
 from argos.datastore import db, join_table
 from argos.core.models import Concept, Event
 from argos.core.models.concept import BaseConceptAssociation
-from argos.core.models.cluster import Cluster
+from argos.core.models.cluster import Cluster, summary_key, join_sentences
 from argos.core.brain.summarizer import multisummarize
 
 import itertools
+from operator import itemgetter
 from nltk.tokenize import sent_tokenize
 
 from argos.util.logger import logger
@@ -90,14 +91,45 @@ class Story(Cluster):
         Breaks up a summary back into its
         original sentences (as a list).
         """
+        if not self.summary:
+            return []
         return sent_tokenize(self.summary)
 
     def summarize(self):
         """
         Generate a summary for this cluster.
         """
-        if self.members.count() == 1:
-            self.summary = self.members[0].summary
+        # Skip events which haven't been summarized yet.
+        members = sorted(self.members, key=lambda m: m.id or 0)
+        summaries = [m.summary for m in members if m.summary]
+        if len(summaries) <= 1:
+            self.summary = ' '.join(summaries)
         else:
-            self.summary = ' '.join(multisummarize([m.summary for m in self.members]))
+            # The summary is cached by its events' summaries.
+            key = summary_key('story', summaries)
+            self.summary = join_sentences(self.cached_summary(key, lambda: multisummarize(summaries, sources=True)))
         return self.summary
+
+    @classmethod
+    def summary_jobs(cls, ids):
+        """
+        The summarizing jobs for stories (see `Cluster.summarize_all`),
+        with the same inputs and cache keys as `summarize`.
+        Their events' summaries are loaded in one query.
+        """
+        rows = db.session.query(stories_events.c.story_id, Event.summary)\
+                .join(Event, Event.id == stories_events.c.event_id)\
+                .filter(stories_events.c.story_id.in_(list(ids)))\
+                .order_by(stories_events.c.story_id, Event.id)
+
+        jobs, keys = [], {}
+        summaries = {id: [] for id in ids}
+        for id, members in itertools.groupby(rows, key=itemgetter(0)):
+            texts = [summary for _, summary in members if summary]
+            if len(texts) <= 1:
+                summaries[id] = [(text, 0) for text in texts]
+            else:
+                del summaries[id]
+                keys[id] = summary_key('story', texts)
+                jobs.append((id, None, texts))
+        return jobs, keys, summaries, {}
@@ -0,0 +1,67 @@
+from argos.tasks import celery
+from argos.core.models import Event, Story
+from argos.datastore import db
+from argos.conf import APP
+
+from celery import chord, group
+from datetime import datetime
+
+# Logging.
+from argos.util.logger import logger
+logger = logger(__name__)
+
+def summarize_later(event_ids, story_ids):
+    """
+    Queues the summarizing and conceptizing of events and stories
+    which were created or updated when snipping the hierarchy.
+
+    The events are updated in parallel (across workers), and the
+    stories after them, since stories are built from their events'
+    summaries and concepts.
+
+    The tasks are delayed by `APP['CLUSTERING']['summarize_countdown']` seconds
+    and debounced: if a cluster's members change again before its task runs,
+    that task is skipped in favor of the one queued by the newer change.
+    """
+    queued_at = datetime.utcnow()
+    countdown = APP['CLUSTERING']['summarize_countdown']
+
+    stories = summarize_stories.si(story_ids, queued_at)
+    if event_ids:
+        events = [summarize_event.si(id, queued_at).set(countdown=countdown) for id in event_ids]
+        chord(events)(stories)
+    elif story_ids:
+        stories.apply_async(countdown=countdown)
+
+@celery.task
+def summarize_event(event_id, queued_at):
+    """
+    Summarizes and conceptizes an event.
+    """
+    e = Event.query.get(event_id)
+
+    # The event was deleted, or its members changed
+    # again and another task was queued for it.
+    if e is None or e.updated_at > queued_at:
+        return
+
+    e.summarize()
+    e.conceptize()
+    db.session.commit()
+
+@celery.task
+def summarize_stories(story_ids, queued_at):
+    """
+    Summarizes and conceptizes stories.
+    """
+    for story_id in story_ids:
+        s = Story.query.get(story_id)
+
+        # The story was deleted, or its members changed
+        # again and another task was queued for it.
+        if s is None or s.updated_at > queued_at:
+            continue
+
+        s.summarize()
+        s.conceptize()
+    db.session.commit()
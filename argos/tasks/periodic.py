@@ -1,9 +1,12 @@
 from argos.tasks import celery, notify
+from argos.tasks.clusters import summarize_later
 
-from argos.core.brain import cluster
+from argos.core.brain import cluster, records
 from argos.core.models import Feed, Article, Event, Story
+from argos.core.models.cluster import SummaryCache
 from argos.core.membrane import collector
 from argos.datastore import db
+from argos.conf import APP
 
 import os
 import random
@@ -19,10 +22,18 @@ def collect():
     Looks for a source which has not been
     updated in at least an hour
     and fetches new articles for it.
+
+    Once there are none left, i.e. a collection cycle is done,
+    the worker which collected the last of them logs what was saved
+    over the cycle by skipping unchanged feeds (see `Feed.cycle_stats`).
     """
+    def stale():
+        return Feed.query.filter(Feed.updated_at < datetime.utcnow() - timedelta(hours=1))
+
     # Get a feed which has not yet been updated
     # and is not currently being updated.
-    feeds = Feed.query.filter(Feed.updated_at < datetime.utcnow() - timedelta(hours=1), ~Feed.updating).all()
+    feeds = stale().filter(~Feed.updating).all()
+
     if feeds:
         feed = random.choice(feeds)
 
@@ -32,8 +43,10 @@ def collect():
         db.session.commit()
 
         try:
-            collector.collect(feed)
+            saved = collector.collect(feed)
             feed.updated_at = datetime.utcnow()
+            feed.saved_bytes = saved['bytes'] if saved is not None else None
+            feed.saved_parse_time = saved['parse_time'] if saved is not None else None
 
         except Exception:
             logger.exception('Exception while collecting for feed {0}'.format(feed.ext_url))
@@ -43,17 +56,54 @@ def collect():
             feed.updating = False
             db.session.commit()
 
+        if not stale().count():
+            logger.info('Collection cycle done: {skipped} of {feeds} feeds unchanged, saved {bytes} bytes and {parse_time:.3f}s of parsing.'.format(**Feed.cycle_stats()))
+
         #notify('Collecting for feed {0} is complete.'.format(feed.ext_url))
 
 @celery.task
 def cluster_articles():
     """
     Clusters articles which have not yet been incorporated into the clustering hierarchy.
+
+    The worker holding the clustering lease keeps clustering
+    chunks of unclustered articles until there are none left.
+    The articles are loaded as lean records (see `argos.core.brain.records`).
+    So if another worker holds the lease, this run is skipped and
+    its articles are merged into that worker's next batch.
+
+    Summarizing the resulting events and stories is queued
+    as separate tasks, so it happens outside of the lease.
     """
-    articles = Article.query.filter(Article.node_id == None).all()
-    if articles:
-        try:
-            cluster.cluster(articles)
-        except cluster.LockException as e:
-            pass
+    try:
+        with cluster.lease():
+            for articles in records.unclustered(APP['CLUSTERING']['chunk_size']):
+                event_ids, story_ids = cluster.cluster(articles, defer=True)
+                summarize_later(event_ids, story_ids)
         #notify('Clustering articles successful.')
+    except cluster.LockException as e:
+        logger.info('Clustering lease is held by another worker, its next batch will include these articles.')
+
+@celery.task
+def expire_events():
+    """
+    Freezes events which have not been updated in a while,
+    and prunes their articles from the clustering hierarchy.
+
+    If another worker holds the clustering lease, this run is skipped;
+    the events are caught on the next run.
+    """
+    try:
+        cluster.expire_events()
+    except cluster.LockException as e:
+        logger.info('Clustering lease is held by another worker, expiring events on the next run.')
+
+@celery.task
+def evict_summaries():
+    """
+    Evicts the least recently used cached summaries,
+    and logs the summary cache's hit rate.
+    """
+    evicted = SummaryCache.evict(APP['CLUSTERING']['summary_cache_size'])
+    stats = SummaryCache.stats()
+    logger.info('Evicted {0} cached summaries. Summary cache: {entries} entries, {hits} hits, {hit_rate:.1%} hit rate.'.format(evicted, **stats))
@@ -42,6 +42,8 @@ if __name__ == '__main__':
 
     # Evaluation
     manager.add_command('profile', core.ProfileCommand())
+    manager.add_command('benchmark:summarizer', core.BenchmarkSummarizerCommand())
+    manager.add_command('evaluate:clustering', core.BenchmarkClusteringCommand())
 
     # Misc
     manager.add_command('db', MigrateCommand)
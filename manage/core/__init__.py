@@ -1,6 +1,7 @@
 from manage.core.sources import *
 from manage.core.seed import *
 from manage.core.profile import *
+from manage.core.benchmark import *
 from manage.core.train import *
 from manage.core.groom import *
 from manage.core.gutcheck import *
@@ -0,0 +1,322 @@
+"""
+Benchmark
+==============
+
+Benchmarks clustering over synthetic corpora,
+or over corpora replayed from `LoadCorporaCommand` dumps,
+to track its performance across changes.
+"""
+
+import os
+import json
+import random
+import shutil
+import resource
+import tempfile
+import traceback
+from time import time
+from datetime import datetime, timedelta
+from collections import defaultdict
+from unittest.mock import patch
+
+from billiard import Process, Pipe
+from flask.ext.script import Command, Option
+from slugify import slugify
+from sklearn import metrics
+
+from argos.datastore import db
+from argos.core.brain import cluster, journal, shards
+from argos.core.models import Article, Event, Story
+from argos.core.models.event import events_articles
+from manage.core.corpora import LoadCorporaCommand
+
+# The phases of clustering which are timed,
+# as the names of the `argos.core.brain.cluster` functions which implement them.
+# Note that these are inclusive, e.g. `snip_hierarchy` includes `triage`
+# and some of the `commit` time.
+PHASES = {
+    'vectorize': 'build_vectors',
+    'fit': 'fit',
+    'save': 'save_hierarchy',
+    'snip': 'snip_hierarchy',
+    'triage': 'triage'
+}
+
+# Synthetic articles' (and concepts') urls start with this.
+SYNTHETIC_URL = 'http://synthetic.argos/'
+
+class BenchmarkClusteringCommand(Command):
+    """
+    Benchmarks `argos.core.brain.cluster` over corpora of
+    different sizes, and outputs the results as JSON.
+
+    By default synthetic corpora are used; pass a `LoadCorporaCommand`
+    dump to replay real articles instead.
+
+    Running this in a production environment
+    is not recommended as it modifies the database;
+    register it under an `evaluate` name so it uses the evaluation database.
+    """
+    option_list = (
+        Option('-s', '--sizes', dest='sizes', type=str, default='1000,10000,100000', required=False),
+        Option('-d', '--dump', dest='dumppath', type=str, required=False),
+        Option('-b', '--batch', dest='batch_size', type=int, default=100, required=False),
+        Option('-o', '--output', dest='output', type=str, required=False)
+    )
+    def run(self, sizes, dumppath, batch_size, output):
+        sizes = [int(size) for size in sizes.split(',')]
+        results = benchmark(sizes, dumppath=dumppath, batch_size=batch_size)
+
+        results = json.dumps(results, sort_keys=True, indent=4)
+        if output:
+            with open(output, 'w') as f:
+                f.write(results)
+        print(results)
+
+def benchmark(sizes, dumppath=None, batch_size=100):
+    """
+    Benchmarks clustering for each corpus size.
+
+    Returns:
+        | list -- a dict of results for each size.
+    """
+    if dumppath:
+        print('Replaying corpora from {0}...'.format(dumppath))
+        LoadCorporaCommand().run(dumppath, use_patch=True)
+        db.session.commit()
+        labels = None
+        query = Article.query
+    else:
+        print('Generating a synthetic corpus of {0} articles...'.format(max(sizes)))
+        labels = synthetic_corpus(max(sizes))
+        query = Article.query.filter(Article.ext_url.startswith(SYNTHETIC_URL))
+
+    results = []
+    for size in sizes:
+        articles = query.order_by(Article.created_at.asc()).limit(size).all()
+        ids = [a.id for a in articles]
+        print('Clustering {0} articles...'.format(len(articles)))
+
+        # Each size is clustered in its own process,
+        # so its peak memory is its own.
+        result = run_apart(benchmark_clustering, ids, batch_size)
+        result['quality'] = quality(articles, labels)
+        results.append(result)
+    return results
+
+def run_apart(func, *args):
+    """
+    Runs `func(*args)` in a child process and returns its result.
+
+    The database connections are dropped first,
+    so that the processes don't share them.
+    """
+    db.session.close()
+    db.engine.dispose()
+
+    receiver, sender = Pipe(duplex=False)
+    def target():
+        try:
+            sender.send((True, func(*args)))
+        except Exception:
+            # Exceptions don't all pickle, so the traceback is printed here.
+            traceback.print_exc()
+            sender.send((False, None))
+        finally:
+            db.session.close()
+            db.engine.dispose()
+
+    process = Process(target=target)
+    process.start()
+    ok, result = receiver.recv()
+    process.join()
+    if not ok:
+        raise RuntimeError('Running {0} in a child process failed.'.format(func.__name__))
+    return result
+
+def benchmark_clustering(ids, batch_size):
+    """
+    Clusters articles from scratch, in batches,
+    timing each phase of clustering.
+
+    This is meant to be run in a fresh process (see `run_apart`),
+    since memory is measured as the process's peak resident set size
+    (and that of its worker processes, e.g. for vectorizing).
+    Its size before clustering is reported as well,
+    since it includes what the process inherited.
+    """
+    reset()
+    articles = Article.query.filter(Article.id.in_(ids)).order_by(Article.created_at.asc()).all()
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Use a scratch hierarchy.
+    tmpdir = tempfile.mkdtemp()
+    paths = cluster.conf['hierarchy_path'], cluster.conf['shard_archive_path']
+    cluster.conf['hierarchy_path'] = os.path.join(tmpdir, 'hierarchy.ihac')
+    cluster.conf['shard_archive_path'] = os.path.join(tmpdir, 'shards')
+
+    timings = defaultdict(float)
+    patchers = [patch.object(cluster, func, timed(getattr(cluster, func), timings, phase)) for phase, func in PHASES.items()]
+    patchers.append(patch.object(db.session, 'commit', timed(db.session.commit, timings, 'commit')))
+    for patcher in patchers:
+        patcher.start()
+
+    try:
+        start_time = time()
+        for i in range(0, len(articles), batch_size):
+            batch = articles[i:i+batch_size]
+
+            # Replay the articles' windows, so shards are frozen as they close.
+            cluster.cluster(batch, defer=True, now=batch[-1].created_at)
+        elapsed_time = time() - start_time
+
+        # `ru_maxrss` is in kilobytes (on Linux).
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_worker_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        # The size of the open shards, i.e. what is loaded when clustering.
+        hierarchy_size = 0
+        for index in shards.shard_indices():
+            path = shards.shard_path(index)
+            hierarchy_size += sum(os.path.getsize(p) for p in [path, path + journal.JOURNAL_EXT] if os.path.exists(p))
+
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+        cluster.conf['hierarchy_path'], cluster.conf['shard_archive_path'] = paths
+        shutil.rmtree(tmpdir)
+
+    return {
+        'articles': len(articles),
+        'batch_size': batch_size,
+        'seconds': elapsed_time,
+        'articles_per_second': len(articles)/elapsed_time if elapsed_time else None,
+        'base_rss_mb': base_rss/1024,
+        'peak_rss_mb': peak_rss/1024,
+        'peak_worker_rss_mb': peak_worker_rss/1024,
+        'hierarchy_bytes': hierarchy_size,
+        'phases': dict(timings)
+    }
+
+def timed(func, timings, phase):
+    """
+    Wraps a function so its running time
+    is added to `timings[phase]`.
+    """
+    def wrapper(*args, **kwargs):
+        start_time = time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[phase] += time() - start_time
+    return wrapper
+
+def reset():
+    """
+    Removes all events and stories and
+    resets all articles' node ids.
+    """
+    Story.query.delete()
+    Event.query.delete()
+    Article.query.update({Article.node_id: None})
+    db.session.commit()
+
+def quality(articles, labels=None):
+    """
+    Cluster-quality metrics for the events built from these articles.
+
+    If true labels are known (i.e. for synthetic corpora),
+    they are compared against the events.
+    """
+    ids = [a.id for a in articles]
+    rows = db.session.query(events_articles.c.article_id, events_articles.c.event_id)\
+            .filter(events_articles.c.article_id.in_(ids)).all()
+    article_events = dict(rows)
+    event_sizes = defaultdict(int)
+    for event_id in article_events.values():
+        event_sizes[event_id] += 1
+
+    results = {
+        'events': len(event_sizes),
+        'stories': Story.query.count(),
+        'mean_event_size': sum(event_sizes.values())/len(event_sizes) if event_sizes else 0,
+        'clustered_fraction': len(article_events)/len(ids) if ids else 0
+    }
+
+    if labels:
+        # Articles which aren't in an event are considered their own cluster.
+        pred = [article_events.get(id, -id) for id in ids]
+        true = [labels[id] for id in ids]
+        homogeneity, completeness, v_measure = metrics.homogeneity_completeness_v_measure(true, pred)
+        results.update({
+            'adjusted_rand_index': metrics.adjusted_rand_score(true, pred),
+            'homogeneity': homogeneity,
+            'completeness': completeness,
+            'v_measure': v_measure
+        })
+
+    return results
+
+def synthetic_corpus(size, seed=0):
+    """
+    Creates a synthetic corpus of articles about topics,
+    with about 20 articles per topic. Each topic has its own
+    vocabulary (drawn from the test documents), concepts, and timespan.
+
+    Returns:
+        | dict -- maps article ids to their topic.
+    """
+    rng = random.Random(seed)
+    words = []
+    for i in range(1, 5):
+        with open('tests/data/multidoc/{0}.txt'.format(i), 'r') as f:
+            words += [w.strip('.,;:"\'()') for w in f.read().split() if w.isalpha()]
+    words = list(set(words))
+
+    num_topics = max(1, size//20)
+    start = datetime(2014, 1, 1)
+    topics = []
+    for t in range(num_topics):
+        topics.append({
+            'words': rng.sample(words, min(50, len(words))),
+            'concepts': ['Synthetic Concept {0}-{1}'.format(t, k) for k in range(5)],
+            'published': start + timedelta(hours=6*t)
+        })
+
+    # Synthetic articles' concepts are known,
+    # so patch out concept extraction and knowledge lookups.
+    concepts_for = {}
+    patchers = [
+        patch('galaxy.concepts', side_effect=lambda text: concepts_for.get(text, [])),
+        patch('argos.core.knowledge.uri_for_name', side_effect=lambda name: '{0}{1}'.format(SYNTHETIC_URL, slugify(name))),
+        patch('argos.core.knowledge.knowledge_for', side_effect=lambda name=None, uri=None, fallback=None: {'summary': '', 'image': None, 'name': uri.split('/')[-1]}),
+        patch('argos.core.knowledge.commonness_for_uri', return_value=0)
+    ]
+    for patcher in patchers:
+        patcher.start()
+
+    labels = {}
+    try:
+        for i in range(size):
+            t = rng.randrange(num_topics)
+            topic = topics[t]
+            text = ' '.join(rng.choice(topic['words']) for _ in range(200))
+            concepts_for[text] = rng.sample(topic['concepts'], 3)
+            published = topic['published'] + timedelta(minutes=rng.randint(0, 360))
+
+            article = Article(
+                title=' '.join(rng.sample(topic['words'], 5)),
+                text=text,
+                ext_url='{0}{1}'.format(SYNTHETIC_URL, i),
+                created_at=published,
+                updated_at=published,
+                score=0.0
+            )
+            db.session.add(article)
+            db.session.commit()
+            labels[article.id] = t
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+
+    return labels
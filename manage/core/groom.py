@@ -16,12 +16,19 @@ import shutil
 from time import time
 
 from flask.ext.script import Command, Option
+from sqlalchemy import or_
 
 from argos.datastore import db
-from argos.core.brain import cluster
-from argos.core.models import Article, Event
+from argos.core.brain import cluster, journal, records, shards
+from argos.core.brain.shards import Shard
+from argos.core.brain.vectors import pipeline_version, vectorize_articles
+from argos.core.models import Article, Event, Story
+from argos.core.models.article import ArticleVector
 from argos.conf import APP
-from argos.util.progress import Progress
+
+# A marker kept next to the hierarchy while a recluster is in progress,
+# so that an interrupted recluster is resumed rather than restarted.
+RECLUSTER_EXT = '.recluster'
 
 class ReclusterCommand(Command):
     """
@@ -29,51 +36,180 @@ class ReclusterCommand(Command):
     You'd really only want to do this if you changed the clustering
     parameters and want to reconstruct the hierarchy with the new params.
 
-    Depending on how many articles you have, this may take a TON of time.
+    The reconstruction happens in phases:
+
+        1. the existing hierarchy is backed up, events and stories are deleted,
+           and the articles' node ids are reset;
+        2. the articles' vectors which are missing or outdated are built, over a process pool;
+        3. the articles are fit in the order they were created, replaying the shards' windows
+           with the shards kept in memory. Each shard is snipped once, when its window closes
+           (or at the end, for the shards which are still open);
+        4. the new events and stories are summarized, over a process pool.
+
+    Every phase commits as it goes (and fits are journaled), so if the
+    reconstruction is interrupted, running this again resumes it.
+    Pass `--restart` to start over instead.
+
+    Depending on how many articles you have, this may take a TON of time;
+    each phase reports its throughput as it runs.
     """
-    def run(self):
-        path = APP['CLUSTERING']['hierarchy_path']
-        path = os.path.expanduser(path)
+    option_list = (
+        Option('-b', '--batch', dest='batch_size', type=int, default=APP['CLUSTERING']['chunk_size'], required=False),
+        Option('-r', '--restart', dest='restart', action='store_true', default=False)
+    )
+    def run(self, batch_size, restart):
+        marker = shards.shard_path(0) + RECLUSTER_EXT
+
+        with cluster.lease():
+            if restart or not os.path.exists(marker):
+                reset_clusters()
+                open(marker, 'a').close()
+            else:
+                print('Resuming the interrupted reconstruction...')
+
+            print('Vectorizing articles...')
+            vectorize_corpus(batch_size)
 
-        if os.path.exists(path):
-            print('Backing up existing hierarchy...')
-            shutil.move(path, path + '.bk')
+            print('Reconstructing the hierarchy...')
+            recluster_corpus(batch_size)
 
-        # Delete existing events.
-        events = Event.query.delete()
+        print('Summarizing events and stories...')
+        summarize_clusters(Event, batch_size)
+        summarize_clusters(Story, batch_size)
 
-        articles = Article.query.filter(Article.node_id != None).all()
+        os.remove(marker)
+        print('Reconstruction done!')
+
+def reset_clusters():
+    """
+    Backs up the existing hierarchy, deletes the existing events and stories,
+    and resets the articles' node ids.
+    """
+    print('Backing up existing hierarchy...')
+    for index in shards.shard_indices():
+        path = shards.shard_path(index)
+        for ext in ['', journal.JOURNAL_EXT, cluster.SNIP_CACHE_EXT]:
+            if os.path.exists(path + ext):
+                shutil.move(path + ext, path + '.bk' + ext)
+
+    # Back up archived shards too.
+    archive_path = os.path.expanduser(APP['CLUSTERING']['shard_archive_path'])
+    if os.path.exists(archive_path):
+        shutil.move(archive_path.rstrip('/'), archive_path.rstrip('/') + '.bk')
+
+    # Delete existing events and stories.
+    Story.query.delete()
+    Event.query.delete()
+
+    # Reset node associations.
+    print('Resetting article-node associations...')
+    Article.query.filter(Article.node_id != None).update({Article.node_id: None}, synchronize_session=False)
+    db.session.commit()
+
+def vectorize_corpus(batch_size):
+    """
+    Builds the articles' missing or outdated vectors, in chunks
+    which are each vectorized over a process pool and then saved.
+    """
+    version = pipeline_version()
+    total = db.session.query(Article.id).outerjoin(ArticleVector, ArticleVector.article_id == Article.id)\
+            .filter(or_(ArticleVector.version == None, ArticleVector.version != version)).count()
 
-        # Reset node associations.
-        print('Resetting article-node associations...')
-        for article in articles:
-            article.node_id = None
+    t = Throughput('vectorized', total)
+    for chunk in records.stale(batch_size):
+        results = vectorize_articles([(r.text, r.concept_slugs) for r in chunk])
+        for r, (bow_vec, con_vec) in zip(chunk, results):
+            r.vector = records.Vector(version, bow_vec, con_vec)
+        records.save_vectors(chunk)
         db.session.commit()
+        t.update(len(chunk))
+    t.done()
 
-        print('Reconstructing the hierarchy...')
-        start_time = time()
+def recluster_corpus(batch_size):
+    """
+    Fits the unclustered articles into the hierarchy in the order they were created,
+    snipping each shard once: just before its window closes, or at the end.
+    """
+    loaded = {}
+    resume_shards(loaded)
 
-        total = Article.query.count()
+    total = Article.query.filter(Article.node_id == None).count()
+    t = Throughput('clustered', total)
+    for chunk in records.unclustered(batch_size, chronological=True):
+        # Replay the articles' windows, so shards are frozen as they close.
+        now = chunk[-1].created_at
 
-        p = Progress()
+        # Snip the shards which are about to be frozen.
+        oldest, _ = shards.open_windows(now)
+        for index, shard in sorted(loaded.items()):
+            if index < oldest and shard.hierarchy is not None:
+                cluster.snip_hierarchy(shard, defer=True)
 
-        # Cluster articles in batches of 1000, for memory's sake.
-        batch_size = 100
-        articles, remaining = get_unclustered_articles(batch_size)
-        p.print_progress((total-remaining)/(total - 1))
-        while articles:
-            cluster.cluster(articles, snip=False)
-            articles, remaining = get_unclustered_articles(batch_size)
-            p.print_progress((total-remaining)/(total - 1))
+        cluster.cluster(chunk, snip=False, now=now, loaded=loaded)
+        t.update(len(chunk))
+    t.done()
 
-        elapsed_time = time() - start_time
-        print('Clustered {0} articles in {1}.'.format(len(articles), elapsed_time))
-        print('Reconstruction done!')
+    print('Snipping the open shards...')
+    for index, shard in sorted(loaded.items()):
+        if shard.hierarchy is not None:
+            cluster.snip_hierarchy(shard, defer=True)
+            cluster.save_hierarchy(shard)
+
+def resume_shards(loaded):
+    """
+    Loads the shards left by an interrupted reconstruction into `loaded`.
+
+    If it was interrupted between fitting a chunk and committing the chunk's
+    node ids, the fitted nodes have no articles. They are pruned when
+    the shards are loaded (see `cluster.prune_orphans`), and their articles are fit again.
+    """
+    for index in shards.shard_indices():
+        shard = Shard(index)
+        cluster.load_hierarchy(shard)
+        loaded[index] = shard
+
+def summarize_clusters(model, batch_size):
+    """
+    Summarizes and conceptizes the events or stories which don't have a summary yet,
+    committing a chunk at a time.
+
+    Each chunk is summarized over a process pool (see `Cluster.summarize_all`).
+    Clusters which time out are left without a summary, so restarting picks them up again.
+    """
+    ids = [id for id, in db.session.query(model.id).filter(model.summary == None).order_by(model.id)]
+
+    t = Throughput('summarized', len(ids))
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i+batch_size]
+        model.summarize_all(chunk)
+        for obj in model.query.filter(model.id.in_(chunk)):
+            obj.conceptize()
+        db.session.commit()
+        t.update(len(chunk))
+    t.done()
+
+class Throughput():
+    """
+    Reports the progress and throughput of a phase.
+    """
+    def __init__(self, verb, total):
+        self.verb = verb
+        self.total = total
+        self.count = 0
+        self.start_time = time()
+
+    def update(self, n):
+        self.count += n
+        elapsed_time = time() - self.start_time
+        rate = self.count/elapsed_time if elapsed_time else 0
+        remaining = (self.total - self.count)/rate if rate else 0
+        print('{0} {1}/{2} ({3:.1f}%) at {4:.1f}/sec, ~{5:.1f}min remaining'.format(
+            self.verb.capitalize(), self.count, self.total,
+            100 * self.count/max(self.total, 1), rate, remaining/60))
 
-def get_unclustered_articles(batch_size):
-    articles = Article.query.filter(Article.node_id == None).order_by(Article.created_at.asc()).limit(batch_size).all()
-    remaining = Article.query.filter(Article.node_id == None).count()
-    return articles, remaining
+    def done(self):
+        elapsed_time = time() - self.start_time
+        print('{0} {1} in {2:.1f}sec.'.format(self.verb.capitalize(), self.count, elapsed_time))
 
 class PreviewEventsCommand(Command):
     option_list = (
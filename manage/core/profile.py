@@ -7,10 +7,17 @@ and identify bottlenecks.
 """
 
 import cProfile, pstats
+import json
+from glob import glob
+from time import time
+from copy import copy
 
-from argos.core.brain.summarizer import summarize, multisummarize
+from argos.core.brain.summarizer import summarize, multisummarize, SentenceClusters
 
-from flask.ext.script import Command
+from flask.ext.script import Command, Option
+
+# The corpus the summarizer is profiled and benchmarked on.
+MULTIDOC_PATH = 'tests/data/multidoc'
 
 class ProfileCommand(Command):
     """
@@ -23,13 +30,13 @@ class ProfileCommand(Command):
 
 def profile_summarize():
     print('argos.core.brain.summarizer.summarize')
-    doc = open('tests/data/multidoc/1.txt', 'r').read()
+    doc = open('{0}/1.txt'.format(MULTIDOC_PATH), 'r').read()
     title = 'This is a title'
     profile_cmd('s(t, d)', None, {'s': summarize, 't': title, 'd': doc})
 
 def profile_multisummarize():
     print('argos.core.brain.summarizer.multisummarize')
-    docs = [open('tests/data/multidoc/{0}.txt'.format(i), 'r').read() for i in range(1,4)]
+    docs = [open('{0}/{1}.txt'.format(MULTIDOC_PATH, i), 'r').read() for i in range(1,4)]
     profile_cmd('s(d)', None, {'s': multisummarize, 'd': docs})
 
 def profile():
@@ -43,3 +50,71 @@ def profile_cmd(*args):
 
     # See which specific func takes the most time.
     ps.sort_stats('time').print_stats(10)
+
+
+class BenchmarkSummarizerCommand(Command):
+    """
+    Benchmarks the summarizer over the multidoc test corpus,
+    and outputs the results as JSON.
+
+    The corpus is repeated (`--scales` times) to measure larger inputs.
+    At each scale, the best of `--runs` runs is reported for:
+
+        - `summarize`: summarizing each document on its own
+        - `multisummarize`: summarizing all the documents at once
+        - `multisummarize_incremental`: adding the last document
+          to the sentence clusters of the others (as when an event gains an article)
+    """
+    option_list = (
+        Option('-s', '--scales', dest='scales', type=str, default='1,5,20', required=False),
+        Option('-r', '--runs', dest='runs', type=int, default=5, required=False),
+        Option('-o', '--output', dest='output', type=str, required=False)
+    )
+    def run(self, scales, runs, output):
+        scales = [int(scale) for scale in scales.split(',')]
+        results = json.dumps(benchmark_summarizer(scales, runs), sort_keys=True, indent=4)
+        if output:
+            with open(output, 'w') as f:
+                f.write(results)
+        print(results)
+
+def benchmark_summarizer(scales, runs):
+    """
+    Benchmarks the summarizer for each scale of the corpus.
+
+    Returns:
+        | list -- a dict of results for each scale.
+    """
+    corpus = [open(path, 'r').read() for path in sorted(glob('{0}/*.txt'.format(MULTIDOC_PATH)))]
+
+    results = []
+    for scale in scales:
+        docs = corpus * scale
+        print('Summarizing {0} documents...'.format(len(docs)))
+
+        # Use each document's first line as its title.
+        titles = [doc.strip().split('\n')[0] for doc in docs]
+
+        clusters = SentenceClusters()
+        multisummarize(docs[:-1], clusters=clusters)
+
+        results.append({
+            'scale': scale,
+            'documents': len(docs),
+            'words': sum(len(doc.split()) for doc in docs),
+            'summarize': best_time(lambda: [summarize(t, d) for t, d in zip(titles, docs)], runs),
+            'multisummarize': best_time(lambda: multisummarize(docs), runs),
+            'multisummarize_incremental': best_time(lambda: multisummarize(docs, clusters=copy(clusters)), runs)
+        })
+    return results
+
+def best_time(func, runs):
+    """
+    Returns the best time (in seconds) of calling `func`.
+    """
+    times = []
+    for i in range(runs):
+        start_time = time()
+        func()
+        times.append(time() - start_time)
+    return min(times)
@@ -141,7 +141,17 @@ def seed(debug=False):
     print('Found {0} concepts.'.format(num_concepts))
 
     print('Clustering articles into events...')
-    cluster.cluster(articles)
+    event_ids, story_ids = cluster.cluster(articles, defer=True)
+
+    # Summarize the new events and stories in bulk (over a process pool),
+    # the stories after the events since they are built from their summaries.
+    for model, ids in [(Event, event_ids), (Story, story_ids)]:
+        if ids:
+            model.summarize_all(ids)
+            for obj in model.query.filter(model.id.in_(ids)):
+                obj.conceptize()
+            db.session.commit()
+
     num_events = Event.query.count()
     print('Created {0} event clusters.'.format(num_events))
 
@@ -2,7 +2,9 @@ import json
 
 from flask.ext.script import Command, Option
 
+from argos.datastore import db
 from argos.core import brain
+from argos.core.models.article import ArticleVector
 from galaxy import concept, vector
 
 class TrainVectorizerCommand(Command):
@@ -24,5 +26,11 @@ class TrainVectorizerCommand(Command):
         if pipetype == 'bow':
             vector.train(docs)
 
+            # The cached article vectors are now stale
+            # (the pipeline's version changed along with it, see `argos.core.brain.vectors.pipeline_version`).
+            print('Invalidating cached article vectors...')
+            ArticleVector.query.delete()
+            db.session.commit()
+
         if pipetype in ['stanford', 'spotlight', 'keyword']:
             concept.train(docs, pipetype=pipetype)
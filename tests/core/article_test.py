@@ -1,7 +1,11 @@
 from tests import RequiresDatabase
 import tests.factories as fac
 
+import os
+import hashlib
+
 from argos.core.models import Article, Concept
+from argos.core.brain import vectors
 
 class ArticleTest(RequiresDatabase):
     def test_conceptize_creates_new_concepts_if_no_existing_concept_is_found(self):
@@ -105,3 +109,41 @@ class ArticleTest(RequiresDatabase):
                 self.assertEqual(concept.score, 0.75)
             else:
                 self.assertEqual(concept.score, 0.25)
+
+    def test_vectorize_caches_vectors(self):
+        self.create_patch('galaxy.concepts', return_value=[])
+        vectorize = self.create_patch('argos.core.brain.vectors.vectorize', return_value=[[1., 0., 1.]])
+        self.create_patch('argos.core.brain.vectors.concept_vectorize', return_value=[[0., 1.]])
+
+        article = Article(title='A title', text='Some text', score=100)
+
+        article.vectorize(version='1')
+        article.vectorize(version='1')
+        self.assertEqual(vectorize.call_count, 1)
+
+        # A new pipeline version invalidates the cached vectors.
+        bow, concepts = article.vectorize(version='2')
+        self.assertEqual(vectorize.call_count, 2)
+        self.assertEqual(article.vector.version, '2')
+        self.assertEqual(bow.shape, (1, 3))
+
+    def test_pipeline_version(self):
+        path = '/tmp/argos_test_pipeline.pickle'
+        vectors.conf['pipeline_path'] = path
+        if os.path.exists(path):
+            os.remove(path)
+
+        # No pipeline has been trained yet.
+        self.assertEqual(vectors.pipeline_version(), '0')
+
+        # The version is the pipeline's hash, so it's the same wherever the pipeline is.
+        with open(path, 'wb') as f:
+            f.write(b'pipeline')
+        version = vectors.pipeline_version()
+        self.assertEqual(version, hashlib.sha1(b'pipeline').hexdigest())
+
+        # Retraining the pipeline changes the version.
+        with open(path, 'wb') as f:
+            f.write(b'retrained pipeline')
+        self.assertNotEqual(vectors.pipeline_version(), version)
+        os.remove(path)
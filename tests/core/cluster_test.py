@@ -1,8 +1,15 @@
 import os
+import shutil
+import unittest
+from unittest.mock import patch
+from glob import glob
 from tests import RequiresDatabase
 from datetime import datetime, timedelta
 
-from argos.core.brain import cluster
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from argos.core.brain import cluster, records, shards, vectors
 from argos.core.models import Article, Event, Story
 
 class ClusterTest(RequiresDatabase):
@@ -16,13 +23,15 @@ class ClusterTest(RequiresDatabase):
         cluster.conf['upper_limit_scale']   = 1.1
         cluster.conf['event_threshold']     = 42.0
         cluster.conf['story_threshold']     = 50.0
-        cluster.LOCK = '/tmp/argos_test_hierarchy.lock'
+        cluster.conf['shard_archive_path']  = '/tmp/argos_test_shards'
+        cluster.conf['shard_days']          = 7
 
-        if os.path.exists(cluster.LOCK):
-            os.remove(cluster.LOCK)
+        # Remove the hierarchy's shards, along with their journals and snip caches.
+        for path in glob('/tmp/argos_test_hierarchy*'):
+            os.remove(path)
 
-        if os.path.exists('/tmp/argos_test_hierarchy'):
-            os.remove('/tmp/argos_test_hierarchy')
+        if os.path.exists('/tmp/argos_test_shards'):
+            shutil.rmtree('/tmp/argos_test_shards')
 
     def prepare_articles(self, type='standard'):
         a = {'title':'Dinosaurs', 'text':'dinosaurs are cool, Clinton', 'score':100}
@@ -76,6 +85,39 @@ class ClusterTest(RequiresDatabase):
         # unchanged => [event_id, ...]
         self.assertEqual(unchanged, [3])
 
+    def test_triage_prefers_exact_matches(self):
+        existing = {
+            1: [0,1,2,3],
+            2: [4,5,6]
+        }
+        # The first new cluster is a candidate for event 1,
+        # but the later one is an exact match.
+        new = [[0,1,2], [6,5,4], [3,2,1,0]]
+
+        to_update, to_create, to_delete, unchanged = cluster.triage(existing, new)
+
+        self.assertEqual(to_update, {})
+        self.assertEqual(to_create, [[0,1,2]])
+        self.assertEqual(to_delete, [])
+        self.assertEqual(unchanged, [1, 2])
+
+    def test_cluster_lease(self):
+        # Hold the lease from another connection, as another worker would.
+        conn = self.db.engine.connect()
+        conn.execute('SELECT pg_advisory_lock({0})'.format(cluster.LOCK_KEY))
+
+        articles = self.prepare_articles()
+        self.assertRaises(cluster.LockException, cluster.cluster, articles)
+
+        # Once that connection goes away, the lease is free again.
+        conn.close()
+        cluster.cluster(articles)
+
+        # The lease is reentrant.
+        with cluster.lease():
+            with cluster.lease():
+                pass
+
     def test_cluster_creates_events(self):
         cluster.conf['min_articles'] = 1
         self.assertEqual(Event.query.count(), 0)
@@ -86,6 +128,19 @@ class ClusterTest(RequiresDatabase):
 
         self.assertTrue(Event.query.count() > 0)
 
+    def test_cluster_defers_summarization(self):
+        cluster.conf['min_articles'] = 1
+        cluster.conf['min_events'] = 1
+        articles = self.prepare_articles()
+        event_ids, story_ids = cluster.cluster(articles, defer=True)
+
+        self.assertTrue(event_ids)
+        self.assertTrue(story_ids)
+        for event in Event.query.all():
+            self.assertTrue(event.id in event_ids)
+            self.assertEqual(event.summary, None)
+            self.assertEqual(event.summary_sentences, [])
+
     def test_cluster_freezes_events(self):
         cluster.conf['min_articles'] = 1
         articles = self.prepare_articles(type='different')
@@ -103,10 +158,17 @@ class ClusterTest(RequiresDatabase):
         new_articles = self.prepare_articles(type='duplicate')
         cluster.cluster(new_articles)
 
+        # Events are only frozen by the expiry job.
+        for event in Event.query.all():
+            self.assertTrue(event.active)
+
+        expired = cluster.expire_events()
+
         # One event gets updated, one doesn't.
         for event in Event.query.all():
             if articles[1] in event.members:
                 self.assertFalse(event.active)
+                self.assertEqual(expired, [event.id])
             else:
                 self.assertTrue(event.active)
 
@@ -167,6 +229,159 @@ class ClusterTest(RequiresDatabase):
         self.assertEqual(Event.query.count(), 1)
         self.assertEqual(Event.query.first().members.all(), [articles[0], articles[2], new_articles[0]])
 
+    def test_cluster_shards_articles(self):
+        cluster.conf['min_articles'] = 1
+        articles = self.prepare_articles(type='different')
+
+        # Put the articles into different windows.
+        now = datetime.utcnow()
+        articles[0].created_at = now - timedelta(days=7)
+        cluster.cluster(articles, now=now)
+
+        previous, current = shards.open_windows(now)
+        self.assertEqual(shards.shard_indices(), [previous, current])
+        self.assertEqual(shards.shard_of(articles[0].node_id), previous)
+        self.assertEqual(shards.shard_of(articles[1].node_id), current)
+        self.assertEqual(Event.query.count(), 2)
+
+    def test_cluster_splits_events_at_window_boundaries(self):
+        cluster.conf['min_articles'] = 1
+        articles = self.prepare_articles(type='duplicate')
+
+        # The same article, just before and just after the current window started.
+        now = datetime.utcnow()
+        start = shards.EPOCH + timedelta(days=(shards.window(now) - 1) * cluster.conf['shard_days'])
+        articles[0].created_at = start - timedelta(minutes=1)
+        articles[1].created_at = start + timedelta(minutes=1)
+        cluster.cluster(articles, now=start + timedelta(hours=1))
+
+        # Each article is only fit into its own window's shard,
+        # so they aren't clustered together.
+        self.assertNotEqual(shards.shard_of(articles[0].node_id), shards.shard_of(articles[1].node_id))
+        self.assertEqual(Event.query.count(), 2)
+        for event in Event.query.all():
+            self.assertEqual(event.members.count(), 1)
+
+    def test_cluster_freezes_shards(self):
+        cluster.conf['min_articles'] = 1
+        articles = self.prepare_articles(type='different')
+        now = datetime.utcnow()
+        cluster.cluster(articles, now=now)
+
+        # Two windows later, the articles' shard has closed.
+        later = now + timedelta(days=14)
+        new_articles = self.prepare_articles(type='duplicate')
+        for article in new_articles:
+            article.created_at = later
+        cluster.cluster(new_articles, now=later)
+
+        index = shards.window(now)
+        self.assertFalse(index in shards.shard_indices())
+        self.assertTrue(os.path.exists(os.path.join('/tmp/argos_test_shards', os.path.basename(shards.shard_path(index)))))
+
+        # The closed shard's events are frozen,
+        # and the new articles got their own events.
+        for event in Event.query.all():
+            if articles[0] in event.members or articles[1] in event.members:
+                self.assertFalse(event.active)
+            else:
+                self.assertTrue(event.active)
+                self.assertEqual(set(event.members.all()), set(new_articles))
+
+    def test_load_hierarchy_replays_journal_without_snapshot(self):
+        cluster.conf['min_articles'] = 1
+        articles = self.prepare_articles(type='different')
+        shard = shards.Shard(shards.window(datetime.utcnow()))
+        cluster.load_hierarchy(shard)
+        node_ids = cluster.fit(shard, cluster.build_vectors(articles, cluster.conf['weights']))
+        for article, node_id in zip(articles, node_ids):
+            article.node_id = node_id
+        self.db.session.commit()
+
+        # Crashing before the first snapshot is saved
+        # keeps the fits which were journaled.
+        self.assertFalse(os.path.exists(shard.path))
+        reloaded = shards.Shard(shard.index)
+        cluster.load_hierarchy(reloaded)
+        self.assertEqual(len(reloaded.hierarchy.ids), len(shard.hierarchy.ids))
+
+    def test_cluster_prunes_nodes_of_failed_commits(self):
+        cluster.conf['min_articles'] = 1
+        articles = self.prepare_articles(type='different')
+
+        # The articles are fit, but committing their node ids fails.
+        with patch.object(self.db.session, 'commit', side_effect=Exception('commit failed')):
+            self.assertRaises(Exception, cluster.cluster, articles)
+        self.db.session.rollback()
+        self.assertEqual(Article.query.filter(Article.node_id != None).count(), 0)
+
+        # Clustering them again prunes the nodes no article holds,
+        # rather than fitting the articles alongside them.
+        cluster.cluster(Article.query.all())
+        shard = shards.Shard(shards.window(datetime.utcnow()))
+        cluster.load_hierarchy(shard)
+        clusters = shard.hierarchy.clusters(distance_threshold=cluster.conf['event_threshold'], with_labels=False)
+        leaves = [shard.node_id(uuid) for clus in clusters for uuid in clus]
+        self.assertEqual(sorted(leaves), sorted(a.node_id for a in Article.query.all()))
+        self.assertEqual(Event.query.count(), 2)
+
+    def test_cluster_keeps_loaded_shards(self):
+        cluster.conf['min_articles'] = 1
+        now = datetime.utcnow()
+        loaded = {}
+
+        articles = self.prepare_articles(type='different')
+        cluster.cluster(articles, now=now, loaded=loaded)
+        index = shards.window(now)
+        shard = loaded[index]
+
+        # The shard is reused rather than reloaded.
+        new_articles = self.prepare_articles(type='duplicate')
+        cluster.cluster(new_articles, now=now, loaded=loaded)
+        self.assertTrue(loaded[index] is shard)
+        self.assertEqual(Event.query.count(), 2)
+
+        # Once its window closes, it is frozen and dropped.
+        later = now + timedelta(days=14)
+        newer_articles = self.prepare_articles(type='standard')
+        for article in newer_articles:
+            article.created_at = later
+        cluster.cluster(newer_articles, now=later, loaded=loaded)
+        self.assertFalse(index in loaded)
+        self.assertFalse(index in shards.shard_indices())
+
+    def test_cluster_records(self):
+        cluster.conf['min_articles'] = 1
+        articles = self.prepare_articles(type='different')
+        expected = [a.concept_slugs for a in articles]
+
+        # Stream the articles in chunks of one.
+        chunks = []
+        for chunk in records.unclustered(1):
+            self.assertEqual(chunk[0].concept_slugs, expected[len(chunks)])
+            cluster.cluster(chunk)
+            chunks.append(chunk)
+
+        self.assertEqual([[r.id for r in chunk] for chunk in chunks], [[a.id] for a in articles])
+        self.assertEqual(list(records.unclustered(1)), [])
+
+        # The node ids and vectors were saved.
+        for article in articles:
+            self.db.session.refresh(article)
+            self.assertTrue(article.node_id is not None)
+            self.assertEqual(article.vector.version, vectors.pipeline_version())
+        self.assertEqual(Event.query.count(), 2)
+
+    def test_member_node_ids(self):
+        cluster.conf['min_articles'] = 1
+        articles = self.prepare_articles(type='different')
+        cluster.cluster(articles)
+
+        events = Event.query.all()
+        members = cluster.member_node_ids([e.id for e in events])
+        for event in events:
+            self.assertEqual(sorted(members[event.id]), sorted(a.node_id for a in event.articles))
+
     def test_cluster_creates_stories(self):
         cluster.conf['min_articles'] = 1
         cluster.conf['min_events'] = 1
@@ -197,3 +412,66 @@ class ClusterTest(RequiresDatabase):
 
         for story in Story.query.all():
             self.assertEqual(story.members.count(), 4)
+
+
+class ClusterHelpersTest(unittest.TestCase):
+    def test_weight_columns(self):
+        vecs = csr_matrix(np.array([[1., 0., 2., 0.],
+                                    [0., 3., 0., 4.]]))
+        weighted = cluster.weight_columns(vecs, [1, 2, 1], [10., 2., 0.5])
+
+        self.assertEqual(weighted.format, 'csr')
+        np.testing.assert_array_equal(weighted.toarray(), [[10., 0., 4., 0.],
+                                                           [0., 6., 0., 2.]])
+
+    def test_dense_rows(self):
+        vecs = csr_matrix(np.array([[1., 0.], [0., 2.]]))
+        rows = list(cluster.dense_rows(vecs))
+        np.testing.assert_array_equal(rows[0], [1., 0.])
+        np.testing.assert_array_equal(rows[1], [0., 2.])
+
+    def test_changed_clusters(self):
+        previous = {frozenset([0,1,2]), frozenset([3,4]), frozenset([5])}
+        clusters = [[0,1,2], [3,4,6], [7]]
+        cluster_sets = [frozenset(clus) for clus in clusters]
+
+        changed, nodes = cluster.changed_clusters(previous, clusters, cluster_sets)
+
+        # [3,4] and [5] no longer exist, [3,4,6] and [7] are new.
+        self.assertEqual(changed, [[3,4,6], [7]])
+        self.assertEqual(nodes, {3,4,5,6,7})
+
+        # Clusters with touched nodes are changed too.
+        changed, nodes = cluster.changed_clusters(previous, clusters, cluster_sets, touched={1})
+        self.assertEqual(changed, [[0,1,2], [3,4,6], [7]])
+
+    def test_shards(self):
+        cluster.conf['shard_days'] = 7
+        now = shards.EPOCH + timedelta(days=70)
+
+        self.assertEqual(shards.window(now), 11)
+        self.assertEqual(shards.open_windows(now), (10, 11))
+
+        # Older articles go into the previous shard, newer ones into the current one.
+        self.assertEqual(shards.shard_for(now - timedelta(days=7), now), 10)
+        self.assertEqual(shards.shard_for(now - timedelta(days=30), now), 10)
+        self.assertEqual(shards.shard_for(now + timedelta(days=7), now), 11)
+
+        shard = shards.Shard(11)
+        node_id = shard.node_id(5)
+        self.assertEqual(shard.uuid(node_id), 5)
+        self.assertEqual(shards.shard_of(node_id), 11)
+        self.assertTrue(shard.node_range[0] <= node_id <= shard.node_range[1])
+
+    def test_vectorize_articles_matches_single_articles(self):
+        docs = [('dinosaurs are cool, Clinton', ['bill-clinton']),
+                ('robots are nice, Clinton', ['bill-clinton']),
+                ('papa was a rodeo, Reagan', ['ronald-reagan'])]
+        expected = [vectors.vectorize_article(text, slugs) for text, slugs in docs]
+
+        results = vectors.vectorize_articles(docs, processes=2, chunk_size=1)
+
+        self.assertEqual(len(results), len(expected))
+        for (bow, con), (bow_, con_) in zip(results, expected):
+            self.assertTrue(np.array_equal(bow.toarray(), bow_.toarray()))
+            self.assertTrue(np.array_equal(con.toarray(), con_.toarray()))
@@ -1,7 +1,9 @@
 from tests import RequiresDatabase
 from datetime import datetime, timedelta
+from unittest.mock import patch
 
 from argos.core.models import Article, Event, Source
+from argos.core.models.cluster import SummaryCache
 
 class EventTest(RequiresDatabase):
     """
@@ -90,6 +92,56 @@ class EventTest(RequiresDatabase):
         self.event = Event(self.prepare_articles())
         self.assertTrue(self.event.summary)
 
+    def test_summarize_caches_summaries(self):
+        articles = self.prepare_articles()
+        self.event = Event(articles)
+        self.assertEqual(SummaryCache.stats()['misses'], 1)
+
+        # Summarizing the same articles again is a lookup.
+        with patch('argos.core.brain.summarizer.multisummarize') as multisummarize:
+            self.event.summarize()
+            self.assertFalse(multisummarize.called)
+        self.assertEqual(SummaryCache.stats()['hits'], 1)
+
+        # Updated articles are summarized again.
+        articles[0].title = 'Dinosaurs are back'
+        self.db.session.commit()
+        with patch('argos.core.brain.summarizer.multisummarize') as multisummarize:
+            multisummarize.return_value = [('a', 0), ('new', 1), ('summary', 0)]
+            self.assertEqual(self.event.summarize(), 'a new summary')
+        self.assertEqual(SummaryCache.stats()['misses'], 2)
+
+        # Least recently used summaries are evicted first.
+        self.assertEqual(SummaryCache.evict(1), 1)
+        self.assertEqual(self.event.summarize(), 'a new summary')
+
+    def test_summarize_all(self):
+        events = [Event(self.prepare_articles(), update=False), Event([self.prepare_articles()[0]], update=False)]
+        for event in events:
+            self.db.session.add(event)
+        self.db.session.commit()
+
+        ids = [e.id for e in events]
+        self.assertEqual(sorted(Event.summarize_all(ids)), sorted(ids))
+        self.db.session.commit()
+        self.assertEqual(SummaryCache.stats()['misses'], 2)
+        self.assertTrue(events[0].sentence_clusters is not None)
+
+        # They are the same summaries as summarizing them one at a time.
+        for event in events:
+            summary, attributions = event.summary, event.attributions
+            self.assertTrue(summary)
+            self.assertEqual(event.summarize(), summary)
+            self.assertEqual(event.attributions, attributions)
+        self.assertEqual(SummaryCache.stats()['hits'], 2)
+
+        # Summaries from the cache keep the clusters' sentence clusters.
+        doc_keys = events[0].sentence_clusters.doc_keys
+        Event.summarize_all(ids)
+        self.db.session.commit()
+        self.assertEqual(SummaryCache.stats()['hits'], 4)
+        self.assertEqual(events[0].sentence_clusters.doc_keys, doc_keys)
+
     def test_summarize_single_article(self):
         self.event = Event([self.prepare_articles()[0]])
         self.assertTrue(self.event.summary)
@@ -123,6 +175,25 @@ class EventTest(RequiresDatabase):
 
         self.assertEqual(self.event.summary_sentences, expected)
 
+    def test_summary_sentences_multiple_articles(self):
+        articles = self.prepare_articles(type='different')
+        for i, article in enumerate(articles):
+            source = Source()
+            source.name = 'Source {0}'.format(i)
+            article.source = source
+            article.ext_url = 'http://foo.com/{0}'.format(i)
+        self.db.session.commit()
+
+        with patch('argos.core.brain.summarizer.multisummarize') as multisummarize:
+            multisummarize.return_value = [('papa was a rodeo', 1), ('', None), ('dinosaurs are cool', 0)]
+            self.event = Event(articles)
+
+        # Each sentence is attributed to the article it was selected from.
+        self.assertEqual(self.event.summary_sentences, [
+            {'sentence': 'papa was a rodeo', 'source': 'Source 1', 'url': 'http://foo.com/1'},
+            {'sentence': 'dinosaurs are cool', 'source': 'Source 0', 'url': 'http://foo.com/0'}
+        ])
+
     def test_timespan(self):
         text = 'the worldly philosophers today cautious optimism is based to a large extent on technological breakthroughs'
         members = [
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from argos.core.brain import journal
+
+class FauxHierarchy():
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write('snapshot')
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'hierarchy')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_append_and_read_entries(self):
+        journal.append(self.path, 'fit', [1, 2, 3])
+        journal.append(self.path, 'prune', [4])
+
+        self.assertEqual(list(journal.entries(self.path)), [('fit', [1, 2, 3]), ('prune', [4])])
+        self.assertEqual(journal.count(self.path), 2)
+
+    def test_recover_truncates_partial_entry(self):
+        journal.append(self.path, 'fit', [1, 2, 3])
+
+        # Simulate a crash in the middle of writing an entry.
+        with open(self.path + journal.JOURNAL_EXT, 'ab') as f:
+            f.write(journal.HEADER.pack(100))
+            f.write(b'partial')
+        self.assertEqual(journal.count(self.path), 1)
+
+        journal.recover(self.path)
+        journal.append(self.path, 'prune', [4])
+
+        self.assertEqual(list(journal.entries(self.path)), [('fit', [1, 2, 3]), ('prune', [4])])
+
+    def test_compact(self):
+        journal.append(self.path, 'fit', [1, 2, 3])
+        journal.compact(FauxHierarchy(), self.path)
+
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(journal.count(self.path), 0)
+        self.assertEqual(os.listdir(self.dir), ['hierarchy'])
+
+    def test_recover_finishes_interrupted_compaction(self):
+        journal.append(self.path, 'fit', [1, 2, 3])
+
+        # Simulate a crash after the new snapshot was saved but before it was moved into place.
+        FauxHierarchy().save(self.path + journal.TMP_EXT)
+        open(self.path + journal.COMPACTING_EXT, 'a').close()
+
+        journal.recover(self.path)
+
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(journal.count(self.path), 0)
+        self.assertEqual(os.listdir(self.dir), ['hierarchy'])
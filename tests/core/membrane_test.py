@@ -1,13 +1,17 @@
 from tests import RequiresMocks, RequiresDatabase
 import tests.factories as fac
 from unittest.mock import MagicMock
+from collections import Counter
 from datetime import datetime
+import threading
+import time
 
 import argos.core.membrane.feed as feed
 import argos.core.membrane.feedfinder as feedfinder
 import argos.core.membrane.collector as collector
 import argos.core.membrane.evaluator as evaluator
 import argos.core.membrane.extractor as extractor
+import argos.tasks.periodic as periodic
 
 from argos.core.models import Source, Feed, Article, Author, Event, Story
 
@@ -207,6 +211,16 @@ class ExtractorTest(RequiresDatabase):
         # Should return expected value from our mocked S3.
         self.assertEqual(image_url, 'fake return')
 
+    def test_extract_image_limited_by_image_host(self):
+        patched_saving = self.create_patch('argos.util.storage.save_from_url', return_value='fake return')
+        entry_data = MagicMock()
+        entry_data.top_image.src = 'http://images.foo.com/bar/image.jpg'
+
+        limit = MagicMock()
+        extractor.extract_image(entry_data, 'downloaded', limit=limit)
+        limit.assert_called_once_with('http://images.foo.com/bar/image.jpg')
+        self.assertTrue(patched_saving.called)
+
 
 class FeedFinderTest(RequiresMocks):
     def setUp(self):
@@ -269,6 +283,11 @@ class CollectorTest(RequiresDatabase):
                )
         self.mock_parse = self.create_patch('feedparser.parse', return_value=data)
 
+        # The feed's body, which is hashed to tell if the feed changed.
+        self.mock_resp = MagicMock(headers={'ETag': '"v1"'})
+        self.mock_resp.read.return_value = b'<rss>v1</rss>'
+        self.mock_request = self.create_patch('argos.core.membrane.collector.make_request', return_value=self.mock_resp)
+
     def patch_articles(self):
         self.mock_articles = self.create_patch('argos.core.membrane.collector.get_articles')
         self.mock_articles.return_value = [
@@ -314,6 +333,34 @@ class CollectorTest(RequiresDatabase):
 
         self.assertEquals(self.feed.errors, 1)
 
+    def test_collect_404_feed(self):
+        from urllib import error
+        self.mock_request.side_effect = error.HTTPError(url=None, code=404, msg=None, hdrs=None, fp=None)
+
+        # The error is noted, rather than raised.
+        self.assertEquals(collector.collect(self.feed), None)
+        self.assertEquals(self.feed.errors, 1)
+        self.assertEquals(self.mock_parse.call_count, 0)
+
+    def test_collect_cycle_logged(self):
+        from datetime import timedelta
+        other = Feed(ext_url='bar', source=self.source)
+        self.db.session.add(other)
+        for feed in [self.feed, other]:
+            feed.updated_at = datetime.utcnow() - timedelta(hours=2)
+        self.db.session.commit()
+
+        # One feed is unchanged, the other is parsed.
+        saved = {'foo': {'bytes': 100, 'parse_time': 0.5}, 'bar': None}
+        self.create_patch('argos.core.membrane.collector.collect', side_effect=lambda feed: saved[feed.ext_url])
+        mock_log = self.create_patch('argos.tasks.periodic.logger.info')
+
+        # The cycle is only logged once every feed has been collected.
+        periodic.collect()
+        self.assertFalse(mock_log.called)
+        periodic.collect()
+        mock_log.assert_called_once_with('Collection cycle done: 1 of 2 feeds unchanged, saved 100 bytes and 0.500s of parsing.')
+
     def test_feed_error_if_no_full_text(self):
         self.assertRaises(Exception, collector.get_articles, self.source)
 
@@ -351,11 +398,36 @@ class CollectorTest(RequiresDatabase):
                     bozo=False
                )
         self.mock_parse.return_value = data
+        self.mock_resp.read.return_value = b'<rss>v2</rss>'
 
         collector.get_articles(self.feed, lambda a: articles.append(a))
 
+        self.assertEquals(self.mock_parse.call_count, 2)
         self.assertEquals(Article.query.count(), 1)
 
+    def test_articles_skips_unchanged_feeds(self):
+        self.patch_extraction()
+
+        articles = []
+        self.assertEquals(collector.get_articles(self.feed, lambda a: articles.append(a)), None)
+        self.assertEquals(self.feed.etag, '"v1"')
+        self.assertEquals(self.feed.content_length, len(b'<rss>v1</rss>'))
+
+        # An unchanged body isn't parsed again.
+        saved = collector.get_articles(self.feed, lambda a: articles.append(a))
+        self.assertEquals(self.mock_parse.call_count, 1)
+        self.assertEquals(saved, {'bytes': 0, 'parse_time': self.feed.parse_time})
+
+        # The request is conditional on the feed's ETag,
+        # and nothing is parsed if it isn't modified.
+        from urllib import error
+        self.mock_request.side_effect = error.HTTPError(url=None, code=304, msg=None, hdrs=None, fp=None)
+        saved = collector.get_articles(self.feed, lambda a: articles.append(a))
+        self.assertEquals(saved['bytes'], len(b'<rss>v1</rss>'))
+        self.assertEquals(self.mock_request.call_args[1]['headers']['If-None-Match'], '"v1"')
+        self.assertEquals(self.mock_parse.call_count, 1)
+        self.assertEquals(len(articles), 1)
+
     def test_articles_skips_short_articles(self):
         extracted_data = MagicMock()
         extracted_data.cleaned_text = 'short full text'
@@ -364,6 +436,39 @@ class CollectorTest(RequiresDatabase):
         collector.get_articles(self.feed, lambda a: articles.append(a))
         self.assertEquals(len(articles), 0)
 
+    def test_articles_fetched_concurrently(self):
+        self.patch_extraction()
+
+        entries = [{
+                'links': [{'href': 'http://{0}.com/{1}'.format(host, i)}],
+                'title': 'title {0} {1}'.format(host, i),
+                'published': 'Thu, 09 Jan 2014 14:00:00 GMT'
+        } for host in ['foo', 'bar'] for i in range(6)]
+        self.mock_parse.return_value = MagicMock(entries=entries, bozo=False)
+
+        # Track how many entries are fetched at once, from each host.
+        lock = threading.Lock()
+        fetching, most = Counter(), Counter()
+        def extract_entry_data(url):
+            host = url.split('/')[2]
+            with lock:
+                fetching[host] += 1
+                most[host] = max(most[host], fetching[host])
+
+            # Later entries are fetched faster, so they finish first.
+            time.sleep(0.2 - 0.02 * int(url.split('/')[-1]))
+            with lock:
+                fetching[host] -= 1
+            entry_data = MagicMock(cleaned_text=full_text, canonical_link=None)
+            return entry_data, full_text
+        self.create_patch('argos.core.membrane.extractor.extract_entry_data', side_effect=extract_entry_data)
+
+        articles = []
+        collector.get_articles(self.feed, lambda a: articles.append(a), workers=8, per_host=2)
+        # The articles are still in the order of the entries.
+        self.assertEquals([a.ext_url for a in articles], [e['links'][0]['href'] for e in entries])
+        self.assertEquals(most, Counter({'foo.com': 2, 'bar.com': 2}))
+
     def test_articles_skips_404_articles(self):
         from urllib import error
         self.create_patch('argos.core.membrane.extractor.extract_entry_data', side_effect=[error.HTTPError(url=None, code=404, msg=None, hdrs=None, fp=None)])
@@ -373,15 +478,34 @@ class CollectorTest(RequiresDatabase):
 
     def test_articles_skips_unreachable_articles(self):
         from urllib import error
-        self.create_patch('argos.core.membrane.extractor.extract_entry_data', side_effect=[error.URLError('unreachable')])
+        self.create_patch('argos.core.membrane.extractor.extract_entry_data', side_effect=error.URLError('unreachable'))
         articles = []
         collector.get_articles(self.feed, lambda a: articles.append(a))
         self.assertEquals(len(articles), 0)
 
+        # The feed is parsed again next time, so the entry is retried.
+        self.assertEquals(self.feed.content_hash, None)
+        collector.get_articles(self.feed, lambda a: articles.append(a))
+        self.assertEquals(self.mock_parse.call_count, 2)
+
+    def test_articles_unreachable_feed(self):
+        from urllib import error
+        self.mock_request.return_value = None
+        self.assertRaises(error.URLError, collector.get_articles, self.feed, lambda a: None)
+
 
 class EvaluatorTest(RequiresDatabase):
     url = 'test'
 
+    def test_score_limited_by_requested_hosts(self):
+        from urllib import error
+        self.create_patch('argos.core.membrane.evaluator.make_request', side_effect=error.HTTPError(url=None, code=500, msg=None, hdrs=None, fp=None))
+
+        limit = MagicMock()
+        self.assertEqual(evaluator.score(self.url, limit=limit), 0)
+        hosts = [call[0][0].split('/')[2] for call in limit.call_args_list]
+        self.assertEqual(hosts, ['www.stumbleupon.com', 'www.linkedin.com', 'api.facebook.com', 'cdn.api.twitter.com'])
+
     def test_facebook(self):
         body = b"""
             <links_getStats_response xmlns="http://api.facebook.com/1.0/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://api.facebook.com/1.0/ http://api.facebook.com/1.0/facebook.xsd" list="true">
@@ -1,4 +1,11 @@
+import time
+import pickle
 import unittest
+from unittest.mock import patch
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
 
 from argos.core.brain import summarizer
 
@@ -15,3 +22,114 @@ class SummarizeTest(unittest.TestCase):
         summary = summarizer.multisummarize(docs, summary_length=5)
         summary_without_nones = list(filter(None, summary))
         self.assertEqual(len(summary_without_nones), 5)
+
+    def test_score(self):
+        sentences = ['Robots and dinosaurs.', 'Robots.']
+        tokens = [['robots', 'dinosaurs'], ['robots']]
+        keywords = {'robots': 2.0, 'dinosaurs': 1.5}
+        ranks = summarizer.score(sentences, ['robots'], keywords, tokens=tokens)
+
+        # title=1, length=0.1, position=0.05, sbs=0.175, dbs=0.25
+        self.assertAlmostEqual(ranks['Robots and dinosaurs.'], 1.475)
+
+        # title=1, length=0.05, position=0.15, sbs=0.2, dbs=0
+        self.assertAlmostEqual(ranks['Robots.'], 0.925)
+
+    def test_multidoc_summarize_incremental(self):
+        docs = [open('tests/data/multidoc/{0}.txt'.format(i+1), 'r').read() for i in range(4)]
+        clusters = summarizer.SentenceClusters()
+        summarizer.multisummarize(docs[:2], clusters=clusters)
+
+        # Adding documents to the (persisted) clusters
+        # is the same as summarizing all of them at once.
+        clusters = pickle.loads(pickle.dumps(clusters))
+        summary = summarizer.multisummarize(docs, clusters=clusters)
+        self.assertEqual(summary, summarizer.multisummarize(docs))
+        self.assertEqual(len(clusters.doc_keys), 4)
+
+        # Each sentence is selected from the document it is attributed to.
+        for sent, i in summarizer.multisummarize(docs, sources=True):
+            self.assertTrue(sent == '' or sent in docs[i])
+
+        # Documents which don't extend the clustered ones are rejected.
+        self.assertRaises(ValueError, summarizer.multisummarize, docs[1:], clusters=clusters)
+
+    def test_summarize_many(self):
+        docs = [open('tests/data/multidoc/{0}.txt'.format(i+1), 'r').read() for i in range(4)]
+        jobs = [(1, 'Why the Middle Class Is Declining', docs[:1]), (2, None, docs[:2]), (3, None, docs)]
+
+        # Jobs are summarized the same over a pool as in this process.
+        results = summarizer.summarize_many(jobs, processes=2, chunk_size=1, clusters=True)
+        self.assertEqual(results[1], ([(sent, 0) for sent in summarizer.summarize(jobs[0][1], docs[0])], None))
+        self.assertEqual(results[3][0], summarizer.multisummarize(docs, sources=True))
+        self.assertEqual(len(results[3][1].doc_keys), 4)
+
+        # Sentence clusters can't be compared directly, so only their structure is.
+        serial = summarizer.summarize_many(jobs, processes=1, clusters=True)
+        self.assertEqual({id: r[0] for id, r in results.items()}, {id: r[0] for id, r in serial.items()})
+        for id in [2, 3]:
+            self.assertEqual(results[id][1].doc_keys, serial[id][1].doc_keys)
+            self.assertTrue(np.array_equal(results[id][1].labels, serial[id][1].labels))
+
+    def test_summarize_many_timeout(self):
+        def slow_multisummarize(docs, **kwargs):
+            time.sleep(5)
+
+        # Jobs which time out are left out.
+        jobs = [(1, 'Dinosaurs', ['Dinosaurs are cool.']), (2, None, ['Robots are nice.', 'Papa was a rodeo.'])]
+        start = time.time()
+        with patch('argos.core.brain.summarizer.multisummarize', slow_multisummarize), \
+                patch.object(summarizer.logger, 'warning') as warning, \
+                patch.object(summarizer.logger, 'exception') as exception:
+            results = summarizer.summarize_many(jobs, processes=1, timeout=0.1)
+        elapsed = time.time() - start
+        self.assertEqual(list(results.keys()), [1])
+
+        # The slow job was cut off by the timeout, rather than failing.
+        self.assertTrue(0.1 <= elapsed < 5)
+        self.assertEqual(warning.call_count, 1)
+        self.assertIn('took over 0.1sec', warning.call_args[0][0])
+        self.assertFalse(exception.called)
+
+    def test_cluster_sentences(self):
+        vecs = normalize(csr_matrix([
+            [1., 0., 0.],
+            [1., 1., 0.],
+            [0., 0., 1.],
+            [0., 0., 0.],
+            [0., 1., 0.]
+        ]))
+        empty = np.array([False, False, False, True, False])
+        clusters, centroids = summarizer.cluster_sentences(vecs, empty, min_sim=0.2)
+
+        # The empty sentence starts its own cluster,
+        # and the last sentence joins the cluster it is most similar to on average.
+        self.assertEqual(clusters, [[0, 1, 4], [2], [3]])
+
+        # The sums of the clusters' vectors.
+        cos = np.sqrt(0.5)
+        np.testing.assert_allclose(centroids.toarray(), [
+            [1 + cos, cos + 1, 0],
+            [0, 0, 1],
+            [0, 0, 0]
+        ])
+
+        # Adding sentences to the existing clusters.
+        more = normalize(csr_matrix([[0., 0., 1.], [1., 0., 0.]]))
+        clusters, centroids = summarizer.cluster_sentences(more, np.array([False, False]), min_sim=0.2,
+                                                           centroids=centroids, sizes=np.array([3., 1., 1.]),
+                                                           joinable=np.array([True, True, False]))
+        self.assertEqual(clusters, [[1], [0], []])
+        np.testing.assert_allclose(centroids.toarray()[:2], [[2 + cos, cos + 1, 0], [0, 0, 2]])
+
+    def test_sentences(self):
+        docs = ['The robots are coming. They are nice.', 'The robots are coming.']
+        sents = summarizer.Sentences(docs)
+
+        self.assertEqual(sents.texts, ['The robots are coming.', 'They are nice.', 'The robots are coming.'])
+        self.assertEqual(sents.positions, [1, 2, 1])
+        self.assertEqual(sents.vecs.shape[0], 3)
+
+        # Shared sentences are tokenized and vectorized once.
+        self.assertEqual(sents.tokens[0], sents.tokens[2])
+        self.assertEqual((sents.vecs[0] != sents.vecs[2]).nnz, 0)
@@ -141,8 +141,9 @@ def faux_concepts(docs):
 def faux_summarize(title, text):
     return ['this', 'is', 'a', 'fake', 'summary']
 
-def faux_multisummarize(docs):
-    return ['this', 'is', 'a', 'fake', 'summary']
+def faux_multisummarize(docs, summary_length=5, clusters=None, sources=False):
+    summary = ['this', 'is', 'a', 'fake', 'summary']
+    return [(sent, 0) for sent in summary] if sources else summary
 
 from galaxy import vectorize
 cached_vector = vectorize('foo bar')